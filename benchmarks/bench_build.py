@@ -0,0 +1,55 @@
+"""
+Build-time encoding throughput per worker count.
+
+Encodes the first --limit chunks of the corpus through build_index's
+encode_shards() with each --workers value and reports chunks/s, including
+the workers' startup (model load), which a build pays as well.
+
+    python -m benchmarks.bench_build --workers 1 2 4 8 --limit 20000
+"""
+import argparse
+import os
+import time
+from itertools import islice
+from pathlib import Path
+
+from build_index import MODEL_NAME, PROTOCOLS, encode_shards
+from src.engine.chunking import Chunker
+from src.engine.encoder import load_encoder
+from src.engine.indexing import iter_chunks, iter_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--protocols", type=Path, default=PROTOCOLS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="default: cores / workers")
+    parser.add_argument("--limit", type=int, default=10_000, help="Chunks to encode per run")
+    parser.add_argument("--shard-size", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    model = load_encoder(MODEL_NAME, backend="torch")
+    chunks = list(islice(iter_chunks(args.protocols, Chunker.for_encoder(model)), args.limit))
+    print(f"{len(chunks)} chunks, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'threads':>8} {'seconds':>9} {'chunks/s':>10} {'speedup':>8}")
+
+    base = None
+    for workers in args.workers:
+        run = argparse.Namespace(
+            workers=workers,
+            threads_per_worker=args.threads_per_worker,
+            batch_size=args.batch_size,
+        )
+        # a single worker encodes in-process with the encoder's default threads
+        threads = "auto" if workers <= 1 else args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        t0 = time.perf_counter()
+        n = sum(len(shard) for shard, _ in encode_shards(model, iter_shards(chunks, args.shard_size), run))
+        elapsed = time.perf_counter() - t0
+        rate = n / elapsed
+        base = base or rate
+        print(f"{workers:>8} {threads:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Encoder backends: parity with PyTorch and latency.
+
+Encodes the same queries with the PyTorch model and each ONNX export
+(model.onnx, model_int8.onnx) found in --onnx-dir. Reports the cosine
+between the backends' embeddings per query and exits non-zero when any falls
+below --min-cosine. Then reports single-query latency and batch throughput
+per backend and thread count.
+
+    python -m benchmarks.bench_encoder --dataset-dir data/test_set --threads 1 4
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.engine.encoder import ONNX_DIR, ONNX_INT8_NAME, ONNX_NAME, OnnxEncoder, load_encoder
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+SAMPLE_QUERIES = [
+    "кашель с мокротой, температура 39, одышка",
+    "внезапный перекос лица и нарушение речи",
+    "боль в правой нижней части живота, тошнота, рвота",
+    "беременность 32 недели, высокое давление, отеки",
+    "жжение при мочеиспускании и боль внизу живота",
+    "жөтел, дене қызуы көтерілген",
+]
+
+
+def load_queries(dataset_dir: Path | None, limit: int):
+    if dataset_dir is None:
+        return SAMPLE_QUERIES
+    files = sorted(dataset_dir.glob("*.json"))[:limit]
+    return [json.loads(f.read_text(encoding="utf-8"))["query"] for f in files]
+
+
+def latency(model, queries, repeat: int, batch_size: int):
+    single = []
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            model.encode([q], normalize_embeddings=True)
+            single.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        model.encode(queries, batch_size=batch_size, normalize_embeddings=True)
+    per_batch_query = (time.perf_counter() - t0) / (repeat * len(queries))
+    p50, p95 = np.percentile(single, [50, 95]) * 1000
+    return p50, p95, 1.0 / per_batch_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--onnx-dir", type=Path, default=ONNX_DIR, help="Directory written by export_encoder.py")
+    parser.add_argument("--dataset-dir", type=Path, default=None, help="Take queries from test case JSON files")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="Encoder thread counts (0: runtime default)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Parity threshold against PyTorch")
+    args = parser.parse_args()
+
+    queries = load_queries(args.dataset_dir, args.limit)
+    variants = [name for name in (ONNX_NAME, ONNX_INT8_NAME) if (args.onnx_dir / name).exists()]
+    if not variants:
+        print(f"no ONNX export in {args.onnx_dir}; run export_encoder.py first")
+        return 1
+
+    reference = load_encoder(MODEL_NAME, backend="torch").encode(queries, normalize_embeddings=True)
+
+    print(f"parity on {len(queries)} queries (cosine vs torch)")
+    ok = True
+    for name in variants:
+        embs = OnnxEncoder(args.onnx_dir, name).encode(queries, normalize_embeddings=True)
+        cos = np.sum(embs * reference, axis=1)
+        passed = bool(cos.min() >= args.min_cosine)
+        ok &= passed
+        print(f"  {name:<18} min={cos.min():.5f} mean={cos.mean():.5f} {'ok' if passed else 'FAIL'}")
+
+    print(f"\n{'backend':<18} {'threads':>7} {'p50 ms':>8} {'p95 ms':>8} {'batch q/s':>10}")
+    for threads in args.threads:
+        backends = [("torch", load_encoder(MODEL_NAME, backend="torch", threads=threads))]
+        backends += [(name, OnnxEncoder(args.onnx_dir, name, threads)) for name in variants]
+        for name, model in backends:
+            model.encode(queries[:1], normalize_embeddings=True)  # warmup
+            p50, p95, qps = latency(model, queries, args.repeat, args.batch_size)
+            print(f"{name:<18} {threads or 'auto':>7} {p50:>8.2f} {p95:>8.2f} {qps:>10.1f}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
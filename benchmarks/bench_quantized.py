@@ -0,0 +1,99 @@
+"""
+Accuracy and scan cost of the corpus-matrix storage modes.
+
+For each mode (float32 flat scan, fp16, int8) the quantized index is built in
+memory from the served version's vectors; every test case then goes through
+the same path as /diagnose. Quantized modes are measured without and with the
+float32 rerank of the top ANN_SEARCH_K candidates. Accuracy@1 / Recall@3 are
+defined as in evaluate.py.
+
+    python -m benchmarks.bench_quantized --dataset-dir data/test_set --search-k 50 200
+"""
+import argparse
+import dataclasses
+import json
+import time
+from pathlib import Path
+
+from src.api.main import diagnose_many
+from src.engine import retrieve
+from src.engine.ann import build_ann, resolve_params
+
+MODES = ("flat", "fp16", "int8")
+
+
+def load_cases(dataset_dir: Path, limit: int | None):
+    files = sorted(dataset_dir.glob("*.json"))[:limit]
+    cases = [json.loads(f.read_text(encoding="utf-8")) for f in files]
+    return [c["query"] for c in cases], [c["gt"] for c in cases]
+
+
+def score(queries, truth, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        results = diagnose_many(queries)
+        best = min(best, time.perf_counter() - t0)
+    top1 = [r[0]["icd10_code"] if r else "" for r in results]
+    top3 = [[d["icd10_code"] for d in r[:3]] for r in results]
+    n = len(truth)
+    return {
+        "accuracy_at_1_percent": round(100 * sum(p == g for p, g in zip(top1, truth)) / n, 2),
+        "recall_at_3_percent": round(100 * sum(g in p for p, g in zip(top3, truth)) / n, 2),
+        "ms_per_query": round(best / n * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset-dir", type=Path, required=True, help="Directory of test case JSON files")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N cases")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--search-k", type=int, nargs="+", default=[retrieve.ANN_SEARCH_K], help="Rerank depths")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Also write the rows as JSON")
+    args = parser.parse_args()
+
+    queries, truth = load_cases(args.dataset_dir, args.limit)
+    base = retrieve.current()
+    if not base.info.get("float32", True):
+        parser.error(f"{base.path} was built with --no-float32; the modes are built from float32 vectors")
+    xb = base.embeddings
+    print(f"{len(queries)} cases, corpus {xb.shape[0]} x {xb.shape[1]} ({base.path})")
+    diagnose_many(queries)  # warm the encoder and the embedding cache
+
+    rows = []
+    for mode in args.modes:
+        if mode == "flat":
+            ann, configs = None, [("-", None)]
+        else:
+            ann = build_ann(xb, mode, resolve_params(mode, len(xb), {}))
+            configs = [(k, rerank) for k in args.search_k for rerank in (False, True)]
+        matrix_mb = (ann.sa_code_size() if ann is not None else xb.shape[1] * 4) * len(xb) / 2**20
+
+        # serve the in-memory variant of the same version
+        retrieve._ACTIVE = dataclasses.replace(base, ann=ann, info={"type": mode, "params": {}})
+        for k, rerank in configs:
+            if ann is not None:
+                retrieve.ANN_SEARCH_K, retrieve.ANN_RERANK = k, rerank
+            row = {
+                "mode": mode,
+                "search_k": k,
+                "rerank": "-" if ann is None else rerank,
+                "matrix_mb": round(matrix_mb, 2),
+                **score(queries, truth, args.repeat),
+            }
+            rows.append(row)
+            print(
+                f"{mode:>5} k={str(k):>4} rerank={str(row['rerank']):>5} "
+                f"matrix={row['matrix_mb']:>8.2f} MB  acc@1={row['accuracy_at_1_percent']:>6.2f}%  "
+                f"recall@3={row['recall_at_3_percent']:>6.2f}%  {row['ms_per_query']:.3f} ms/query"
+            )
+    retrieve._ACTIVE = base
+
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
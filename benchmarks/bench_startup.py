@@ -0,0 +1,74 @@
+"""
+API startup cost: import time, app startup, first /health and first /diagnose.
+
+Each run starts a fresh interpreter so nothing is cached between runs, and
+is repeated per WARMUP mode (block / background / off). Peak RSS is measured
+after import and after the first /diagnose.
+
+    python -m benchmarks.bench_startup --repeat 3
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("block", "background", "off")
+FIELDS = ("import_s", "startup_s", "health_s", "first_diagnose_s", "rss_import_mb", "rss_mb")
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child() -> None:
+    from fastapi.testclient import TestClient
+
+    t0 = time.perf_counter()
+    import src.api.main as api
+
+    out = {"import_s": time.perf_counter() - t0, "rss_import_mb": _rss_mb()}
+    t0 = time.perf_counter()
+    with TestClient(api.app) as client:
+        out["startup_s"] = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        client.get("/health").raise_for_status()
+        out["health_s"] = time.perf_counter() - t1
+        t1 = time.perf_counter()
+        client.post("/diagnose", json={"symptoms": "кашель с мокротой и температура"}).raise_for_status()
+        out["first_diagnose_s"] = time.perf_counter() - t1
+    out["rss_mb"] = _rss_mb()
+    print(json.dumps(out))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    print(f"{'WARMUP':<11}" + "".join(f"{f:>18}" for f in FIELDS))
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+                env={**os.environ, "WARMUP": mode},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        medians = {f: statistics.median(r[f] for r in runs) for f in FIELDS}
+        print(f"{mode:<11}" + "".join(f"{medians[f]:>18.3f}" for f in FIELDS))
+
+
+if __name__ == "__main__":
+    main()
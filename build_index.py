@@ -1,40 +1,402 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+import argparse
+import hashlib
 import json
+import multiprocessing as mp
+import os
+import time
 
 import faiss
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
-from src.engine.indexing import load_chunks, save_metadata
+from src.engine.ann import (
+    ANN_NAME,
+    DEFAULT_PARAMS,
+    INDEX_TYPES,
+    QUANTIZED_TYPES,
+    build_ann,
+    flat_vectors,
+    recall_report,
+    resolve_params,
+)
+from src.engine.bm25 import BM25_DIR, BM25Writer
+from src.engine.chunking import Chunker
+from src.engine.columnar import COLUMNS_DIR, TEXT_COLUMN, ColumnWriter, load_string_column, save_embeddings
+from src.engine.encoder import load_encoder
+from src.engine.indexing import (
+    FAISS_NAME,
+    META_NAME,
+    Chunk,
+    MetadataWriter,
+    chunk_metadata,
+    content_hash,
+    iter_chunks,
+    iter_shards,
+    load_manifest,
+    protocol_key,
+    publish_version,
+    resolve_index_dir,
+    save_manifest,
+    stage_version,
+)
 
 BASE = Path(__file__).resolve().parent
 PROTOCOLS = BASE / "data" / "raw" / "protocols" / "protocols_corpus.jsonl"
 INDEX_DIR = BASE / "data" / "index"
-FAISS_PATH = INDEX_DIR / "embeddings.faiss"
-META_PATH = INDEX_DIR / "metadata.json"
 
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 
 
-def main():
-    chunks = load_chunks(PROTOCOLS)
-    texts = [c.text for c in chunks]
+def combine_hashes(hashes: List[str]) -> str:
+    return hashlib.sha1("".join(hashes).encode("utf-8")).hexdigest()
 
-    model = SentenceTransformer(MODEL_NAME)
-    embs = model.encode(texts, batch_size=32, show_progress_bar=True, normalize_embeddings=True)
 
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine if embeddings normalized
-    index.add(embs)
+def make_chunker(args, model: SentenceTransformer) -> Chunker:
+    """Windows sized to the encoder's input (or --chunk-tokens), counted with its tokenizer."""
+    return Chunker.for_encoder(model, args.chunk_tokens, args.chunk_overlap)
+
+
+def protocol_hashes(protocols: Path, chunker: Chunker) -> Dict[str, str]:
+    """protocol key -> hash over every chunk of that protocol (streamed)."""
+    parts: Dict[str, List[str]] = {}
+    for c in iter_chunks(protocols, chunker):
+        parts.setdefault(protocol_key(c), []).append(content_hash(c))
+    return {k: combine_hashes(v) for k, v in parts.items()}
+
+
+# encoder of a --workers process, loaded once by the pool initializer
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _worker_model
+    _worker_model = load_encoder(model_name, backend="torch", threads=threads)
+
+
+def _encode_texts(texts: List[str], batch_size: int) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+
+def encode_shards(
+    model: SentenceTransformer, shards: Iterable[List[Chunk]], args
+) -> Iterator[Tuple[List[Chunk], np.ndarray]]:
+    """
+    (shard, embeddings) in shard order. With --workers > 1 the shards are
+    encoded by a process pool, each worker with its own encoder and
+    --threads-per-worker threads; at most 2 shards per worker are in flight,
+    so memory stays bounded.
+    """
+    if args.workers <= 1:
+        for shard in shards:
+            yield shard, model.encode(
+                [c.text for c in shard],
+                batch_size=args.batch_size,
+                normalize_embeddings=True,
+            )
+        return
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    # spawn: torch thread pools don't survive fork
+    with ProcessPoolExecutor(
+        args.workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(MODEL_NAME, threads),
+    ) as pool:
+        pending = deque()
+        for shard in shards:
+            pending.append((shard, pool.submit(_encode_texts, [c.text for c in shard], args.batch_size)))
+            if len(pending) >= 2 * args.workers:
+                done, fut = pending.popleft()
+                yield done, fut.result()
+        while pending:
+            done, fut = pending.popleft()
+            yield done, fut.result()
+
+
+def add_chunks(
+    index,
+    model: SentenceTransformer,
+    chunks: Iterable[Chunk],
+    next_id: int,
+    args,
+    on_shard: Callable[[List[Chunk], np.ndarray], None],
+) -> int:
+    """Encodes `chunks` shard by shard into `index` under fresh ids; returns the next free id."""
+    t0 = time.perf_counter()
+    n = 0
+    for shard, embs in encode_shards(model, iter_shards(chunks, args.shard_size), args):
+        ids = np.arange(next_id, next_id + len(shard), dtype=np.int64)
+        index.add_with_ids(embs, ids)
+        on_shard(shard, ids)
+        next_id += len(shard)
+        n += len(shard)
+        print(f"encoded {index.ntotal} chunks", flush=True)
+
+    elapsed = time.perf_counter() - t0
+    if n:
+        print(f"encoding: {n} chunks in {elapsed:.1f}s, {n / elapsed:.1f} chunks/s ({args.workers} workers)")
+    return next_id
+
+
+def ann_settings(args, previous: Dict | None) -> Dict:
+    """Index type + tunables (and float32 copy or not): CLI flags, else the previous version's, else defaults."""
+    previous = previous or {"type": "flat", "params": {}}
+    index_type = args.index_type or previous["type"]
+    base = previous["params"] if index_type == previous["type"] else {}
+    flags = {
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "M": args.hnsw_m,
+        "efConstruction": args.ef_construction,
+        "efSearch": args.ef_search,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+    }
+    overrides = {
+        k: v for k, v in {**base, **flags}.items()
+        if v is not None and k in DEFAULT_PARAMS[index_type]
+    }
+    settings = {"type": index_type, "params": overrides}
+    float32 = args.float32
+    if float32 is None:
+        float32 = previous.get("float32", True) if index_type == previous["type"] else True
+    if not float32:
+        if index_type not in QUANTIZED_TYPES:
+            raise ValueError(f"--no-float32 needs a quantized index type, not {index_type}")
+        settings["float32"] = False
+    return settings
+
+
+def write_version(args, index, manifest: Dict, name: str, staging: Path) -> Path:
+    """Writes the flat index, the optional ANN index and the manifest, then publishes."""
+    settings = manifest["index"]
+    if settings["type"] != "flat":
+        params = resolve_params(settings["type"], index.ntotal, settings["params"])
+        # labels of the ANN index are flat positions, i.e. metadata order
+        ann = build_ann(flat_vectors(index), settings["type"], params)
+        report = recall_report(index, ann, k=args.report_k)
+        faiss.write_index(ann, str(staging / ANN_NAME))
+        manifest["index"] = {**settings, "params": params, "report": report}
+        print(
+            f"{settings['type']} {params}: recall@{report['k']}={report['recall']:.4f}, "
+            f"{report['ann_latency_ms']:.3f} ms/query vs flat {report['flat_latency_ms']:.3f} ms/query "
+            f"(x{report['speedup']})"
+        )
+
+    # kept in every version: incremental builds start from the previous version's flat index
+    faiss.write_index(index, str(staging / FAISS_NAME))
+    if settings.get("float32", True):
+        # the API maps this copy instead of the faiss file, shared by all workers
+        save_embeddings(flat_vectors(index), staging)
+    save_manifest(manifest, staging)
+    return publish_version(args.index_dir, name, staging, keep=args.keep)
+
 
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(FAISS_PATH))
-    save_metadata(chunks, META_PATH)
+def full_build(args, model: SentenceTransformer) -> Path:
+    index = faiss.IndexIDMap2(
+        faiss.IndexFlatIP(model.get_sentence_embedding_dimension())  # cosine if embeddings normalized
+    )
+    protocols: Dict[str, Dict] = {}
+    chunker = make_chunker(args, model)
+    settings = ann_settings(args, None)
+    name, staging = stage_version(args.index_dir)
+
+    # corpus is streamed: only one shard of texts/embeddings is alive at a time
+    with MetadataWriter(staging / META_NAME) as meta, ColumnWriter(staging) as columns, BM25Writer(staging) as bm25:
+        def on_shard(shard: List[Chunk], ids: np.ndarray) -> None:
+            records = [chunk_metadata(c, i) for c, i in zip(shard, ids)]
+            for w in (meta, columns, bm25):
+                w.write_records(records)
+            for c, i in zip(shard, ids):
+                entry = protocols.setdefault(protocol_key(c), {"hashes": [], "ids": []})
+                entry["hashes"].append(content_hash(c))
+                entry["ids"].append(int(i))
+
+        next_id = add_chunks(index, model, iter_chunks(args.protocols, chunker), 0, args, on_shard)
+
+    manifest = {
+        "model": MODEL_NAME,
+        "next_id": next_id,
+        "chunking": chunker.config(),
+        "index": settings,
+        "protocols": {
+            k: {"hash": combine_hashes(v["hashes"]), "ids": v["ids"]}
+            for k, v in protocols.items()
+        },
+    }
+    print("chunks:", meta.count)
+    return write_version(args, index, manifest, name, staging)
+
+
+def incremental_build(args, model: SentenceTransformer) -> Path | None:
+    """
+    Re-embeds only new or changed protocols and drops deleted ones from the
+    previous version (ID-mapped index), then publishes the result as a new version.
+    """
+    prev_dir = resolve_index_dir(args.index_dir)
+    manifest = load_manifest(prev_dir)
+    if manifest is None or manifest.get("model") != MODEL_NAME:
+        print("no compatible previous version, running a full build")
+        return full_build(args, model)
+
+    # other window sizes give other chunk texts, hence other hashes: such a
+    # change re-embeds every protocol
+    chunker = make_chunker(args, model)
+    old = manifest["protocols"]
+    new_hashes = protocol_hashes(args.protocols, chunker)
+    changed = {k for k, h in new_hashes.items() if old.get(k, {}).get("hash") != h}
+    removed = set(old) - set(new_hashes)
+    print(
+        f"protocols: {len(changed - set(old))} new, {len(changed & set(old))} changed, "
+        f"{len(removed)} removed, {len(new_hashes) - len(changed)} unchanged"
+    )
+    settings = ann_settings(args, manifest.get("index"))
+    has_bm25 = (prev_dir / BM25_DIR).is_dir()
+    if not changed and not removed and settings == _settings_of(manifest) and has_bm25:
+        print("index is up to date")
+        return None
+
+    index = faiss.read_index(str(prev_dir / FAISS_NAME))
+    prev_meta = json.loads((prev_dir / META_NAME).read_text(encoding="utf-8"))
+    # chunk texts, needed to rebuild the text column and BM25, are in the text
+    # column (by index position, like metadata.json) or, in older versions, inline
+    text_path = prev_dir / COLUMNS_DIR / f"{TEXT_COLUMN}.bin"
+    if text_path.exists():
+        texts = load_string_column(prev_dir / COLUMNS_DIR, TEXT_COLUMN)
+        for pos, m in enumerate(prev_meta):
+            m["text"] = texts[pos]
+    if any("text" not in m for m in prev_meta):
+        print("previous version has no chunk texts to build the BM25 index from, running a full build")
+        return full_build(args, model)
+    meta_by_id = {m["id"]: m for m in prev_meta}
+
+    stale = [i for k in changed | removed for i in old.get(k, {}).get("ids", [])]
+    index.remove_ids(np.asarray(stale, dtype=np.int64))
+    for i in stale:
+        meta_by_id.pop(i, None)
+
+    protocols = {k: v for k, v in old.items() if k not in changed and k not in removed}
+    for k in changed:
+        protocols[k] = {"hash": new_hashes[k], "ids": []}
+
+    def on_shard(shard: List[Chunk], ids: np.ndarray) -> None:
+        for c, i in zip(shard, ids):
+            meta_by_id[int(i)] = chunk_metadata(c, int(i))
+            protocols[protocol_key(c)]["ids"].append(int(i))
+
+    fresh = (c for c in iter_chunks(args.protocols, chunker) if protocol_key(c) in changed)
+    next_id = add_chunks(index, model, fresh, manifest["next_id"], args, on_shard)
+
+    name, staging = stage_version(args.index_dir)
+    # metadata follows index positions, which remove_ids keeps compact and in order
+    order = faiss.vector_to_array(faiss.downcast_index(index).id_map)
+    with MetadataWriter(staging / META_NAME) as meta, ColumnWriter(staging) as columns, BM25Writer(staging) as bm25:
+        for w in (meta, columns, bm25):
+            w.write_records(meta_by_id[int(i)] for i in order)
+
+    manifest = {
+        "model": MODEL_NAME,
+        "next_id": next_id,
+        "chunking": chunker.config(),
+        "index": settings,
+        "protocols": protocols,
+    }
+    print("chunks:", index.ntotal)
+    return write_version(args, index, manifest, name, staging)
+
+
+def _settings_of(manifest: Dict) -> Dict:
+    info = manifest.get("index") or {"type": "flat", "params": {}}
+    settings = {"type": info["type"], "params": info["params"]}
+    if "float32" in info:
+        settings["float32"] = info["float32"]
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAISS index over protocols")
+    parser.add_argument("--protocols", type=Path, default=PROTOCOLS, help="Protocols corpus (JSONL)")
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR, help="Index root directory")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-embed only new/changed protocols (by protocol_id + content hash) on top of the current version",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=2048,
+        help="Chunks encoded and appended to the index at a time; bounds peak memory (default: 2048)",
+    )
+    parser.add_argument("--batch-size", type=int, default=32, help="Encoder batch size (default: 32)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Encoder processes; shards are encoded in parallel and merged in order (default: 1)",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=0,
+        help="Encoder threads per worker process (default: cores / workers)",
+    )
+    parser.add_argument("--keep", type=int, default=3, help="Index versions to retain (default: 3)")
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=None,
+        help="Encoder tokens per chunk window (default: the encoder's max sequence length)",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=None,
+        help="Tokens shared by consecutive windows of a protocol (default: a quarter of the window)",
+    )
+
+    ann = parser.add_argument_group("index type", "ANN index built next to the flat vectors (default: flat only)")
+    ann.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=None,
+        help="flat | ivf (IVF-Flat) | hnsw | ivfpq (IVF-PQ) | fp16 / int8 (quantized exhaustive scan)",
+    )
+    ann.add_argument("--nlist", type=int, help="IVF lists (ivf, ivfpq)")
+    ann.add_argument("--nprobe", type=int, help="IVF lists probed per query (ivf, ivfpq)")
+    ann.add_argument("--hnsw-m", type=int, help="HNSW graph degree M")
+    ann.add_argument("--ef-construction", type=int, help="HNSW efConstruction")
+    ann.add_argument("--ef-search", type=int, help="HNSW efSearch")
+    ann.add_argument("--pq-m", type=int, help="PQ sub-quantizers; must divide the embedding dim (ivfpq)")
+    ann.add_argument("--pq-nbits", type=int, help="Bits per PQ code (ivfpq)")
+    ann.add_argument(
+        "--float32",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="--no-float32 (fp16 / int8): serve from the quantized vectors alone, without "
+        "embeddings.npy and so without the exact float32 rerank (default: as the previous version, else kept)",
+    )
+    ann.add_argument("--report-k", type=int, default=20, help="k of the recall@k report against flat (default: 20)")
+    args = parser.parse_args()
+    if args.float32 is False and args.index_type not in (None, *QUANTIZED_TYPES):
+        parser.error(f"--no-float32 needs --index-type {' or '.join(QUANTIZED_TYPES)}")
+
+    t0 = time.perf_counter()
+    model = SentenceTransformer(MODEL_NAME)
+    version_dir = incremental_build(args, model) if args.incremental else full_build(args, model)
 
     print("OK")
-    print("chunks:", len(chunks))
-    print("faiss:", FAISS_PATH)
-    print("meta:", META_PATH)
+    if version_dir is not None:
+        print("version:", version_dir.name)
+        print("faiss:", version_dir / FAISS_NAME)
+        print("meta:", version_dir / META_NAME)
+    print(f"elapsed: {time.perf_counter() - t0:.1f}s")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
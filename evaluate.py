@@ -84,11 +84,12 @@ async def run_evaluation(
     endpoint: str,
     dataset_dir: Path,
     parallelism: int,
+    limit: int | None = None,
 ) -> list[EvaluationResult]:
-    """Run evaluation on all JSON files in the dataset directory."""
+    """Run evaluation on the JSON files in the dataset directory (the first `limit`, if set)."""
     console = Console()
 
-    json_files = sorted(dataset_dir.glob("*.json"))[:30]
+    json_files = sorted(dataset_dir.glob("*.json"))[:limit]
     if not json_files:
         console.print(f"[red]No JSON files found in {dataset_dir}[/red]")
         return []
@@ -180,6 +181,85 @@ def compute_metrics(results: list[EvaluationResult]) -> dict:
     }
 
 
+def compare_metrics(metrics: dict, baseline: dict) -> dict:
+    """Change of accuracy (points) and latency (s) against a baseline run's metrics."""
+    keys = [
+        "accuracy_at_1_percent",
+        "recall_at_3_percent",
+        "latency_avg_s",
+        "latency_p50_s",
+        "latency_p95_s",
+    ]
+    return {
+        k: round(metrics[k] - baseline[k], 3) for k in keys if k in metrics and k in baseline
+    }
+
+
+def display_comparison(name: str, baseline_name: str, delta: dict, console: Console):
+    """Accuracy gained against latency added, relative to the baseline run."""
+    table = Table(
+        title=f"[bold]{name} vs {baseline_name}[/bold]",
+        show_header=True,
+        header_style="bold magenta",
+        border_style="cyan",
+    )
+    table.add_column("Metric", style="cyan", width=22)
+    table.add_column("Change", justify="right", width=15)
+    for key, value in delta.items():
+        # more accuracy is better, more latency is worse
+        good = value >= 0 if key.endswith("_percent") else value <= 0
+        unit = " pts" if key.endswith("_percent") else " s"
+        table.add_row(key, f"[{'green' if good else 'red'}]{value:+.3f}{unit}[/]")
+    console.print(table)
+    console.print()
+
+
+def fetch_index_info(endpoint: str) -> dict | None:
+    """Index type the API behind `endpoint` serves (its /index), or None if unavailable."""
+    try:
+        response = httpx.get(str(httpx.URL(endpoint).copy_with(path="/index")), timeout=10.0)
+        response.raise_for_status()
+        return response.json().get("index")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def describe_index(info: dict | None) -> str:
+    if not info:
+        return "unknown"
+    if info.get("float32", True) or info["type"] == "flat":
+        return info["type"]
+    return f"{info['type']} (no float32)"
+
+
+def display_modes(rows: list[tuple[str, dict | None, dict]], console: Console):
+    """Accuracy@1 / Recall@3 and latency per index mode, with the change against the first mode."""
+    first = rows[0][2]
+    table = Table(
+        title=f"[bold]Index modes vs {rows[0][0]}[/bold]",
+        show_header=True,
+        header_style="bold magenta",
+        border_style="cyan",
+    )
+    table.add_column("Mode", style="cyan")
+    table.add_column("Served index")
+    for column in ("Accuracy@1", "Recall@3", "P50 (s)", "Δ Acc@1", "Δ Recall@3"):
+        table.add_column(column, justify="right")
+    for mode, info, metrics in rows:
+        delta = compare_metrics(metrics, first)
+        table.add_row(
+            mode,
+            describe_index(info),
+            f"{metrics['accuracy_at_1_percent']:.2f}%",
+            f"{metrics['recall_at_3_percent']:.2f}%",
+            f"{metrics['latency_p50_s']:.3f}",
+            f"{delta['accuracy_at_1_percent']:+.2f} pts",
+            f"{delta['recall_at_3_percent']:+.2f} pts",
+        )
+    console.print(table)
+    console.print()
+
+
 def write_jsonl(results: list[EvaluationResult], output_path: Path):
     """Write results to JSONL file."""
     with open(output_path, "w") as f:
@@ -267,6 +347,36 @@ def display_summary(
     console.print(Panel(success_text, border_style="green"))
 
 
+def run_modes(args, modes: list[list[str]], console: Console) -> int:
+    """One evaluation per index mode, saved as <name>_<mode>, then the per-mode comparison."""
+    rows = []
+    for mode, endpoint in modes:
+        info = fetch_index_info(endpoint)
+        results = asyncio.run(
+            run_evaluation(
+                endpoint=endpoint,
+                dataset_dir=args.dataset_dir,
+                parallelism=args.parallelism,
+                limit=args.limit,
+            )
+        )
+        if not results:
+            console.print(f"[red]No results for mode {mode}[/red]")
+            return 1
+
+        name = f"{args.name}_{mode}"
+        output_jsonl = args.output_dir / f"{name}.jsonl"
+        output_json = args.output_dir / f"{name}_metrics.json"
+        write_jsonl(results, output_jsonl)
+        metrics = {**compute_metrics(results), "mode": mode, "index": info}
+        write_metrics_json(name, metrics, output_json)
+        display_summary(results, metrics, output_jsonl, output_json, console)
+        rows.append((mode, info, metrics))
+
+    display_modes(rows, console)
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Evaluate diagnostic accuracy against an endpoint",
@@ -275,6 +385,8 @@ def main():
 Examples:
   python main.py --endpoint http://localhost:8000/diagnose --dataset-dir ./data --name my_submission
   python main.py -e http://api.example.com/diagnose -d ./protocols -n team_alpha -p 10
+  python main.py -e http://localhost:8000/diagnose -d ./data -n rerank -b no_rerank
+  python main.py -d ./data -n quant -m flat=http://localhost:8000/diagnose -m int8=http://localhost:8001/diagnose
         """,
     )
     parser.add_argument(
@@ -286,7 +398,6 @@ Examples:
     parser.add_argument(
         "-e",
         "--endpoint",
-        required=True,
         help="URL of the diagnostic endpoint",
     )
     parser.add_argument(
@@ -303,6 +414,27 @@ Examples:
         default=2,
         help="Number of simultaneous requests (default: 2)",
     )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        type=int,
+        default=None,
+        help="Evaluate only the first N files (default: all)",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        default=None,
+        help="Name of an earlier run in the output dir to compare accuracy and latency against",
+    )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        action="append",
+        metavar="MODE=ENDPOINT",
+        help="Instead of --endpoint: compare index modes (e.g. flat, fp16, int8), each served "
+        "by its own API; repeat per mode. Reports Accuracy@1 / Recall@3 per mode against the first",
+    )
     parser.add_argument(
         "-o",
         "--output-dir",
@@ -313,6 +445,13 @@ Examples:
 
     args = parser.parse_args()
     console = Console()
+    if bool(args.endpoint) == bool(args.mode):
+        parser.error("give either --endpoint or one or more --mode")
+    if args.mode and args.baseline:
+        parser.error("--baseline compares single runs; --mode compares against the first mode")
+    modes = [spec.split("=", 1) for spec in args.mode or []]
+    if any(len(m) != 2 or not all(m) for m in modes):
+        parser.error("--mode takes MODE=ENDPOINT")
 
     if not args.dataset_dir.exists():
         console.print(
@@ -325,12 +464,20 @@ Examples:
         return 1
 
     args.output_dir.mkdir(parents=True, exist_ok=True)
+    baseline_path = args.output_dir / f"{args.baseline}_metrics.json"
+    if args.baseline and not baseline_path.exists():
+        console.print(f"[red]Error: baseline metrics '{baseline_path}' not found[/red]")
+        return 1
+
+    if modes:
+        return run_modes(args, modes, console)
 
     results = asyncio.run(
         run_evaluation(
             endpoint=args.endpoint,
             dataset_dir=args.dataset_dir,
             parallelism=args.parallelism,
+            limit=args.limit,
         )
     )
 
@@ -340,8 +487,15 @@ Examples:
 
         write_jsonl(results, output_jsonl)
         metrics = compute_metrics(results)
+        delta = None
+        if args.baseline:
+            with open(baseline_path) as f:
+                delta = compare_metrics(metrics, json.load(f))
+            metrics = {**metrics, "baseline": args.baseline, "delta": delta}
         write_metrics_json(args.name, metrics, output_json)
         display_summary(results, metrics, output_jsonl, output_json, console)
+        if delta is not None:
+            display_comparison(args.name, args.baseline, delta, console)
 
     return 0
 
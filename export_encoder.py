@@ -0,0 +1,33 @@
+from pathlib import Path
+import argparse
+import time
+
+from src.engine.encoder import CONFIG_NAME, ONNX_INT8_NAME, ONNX_NAME, export_onnx
+
+BASE = Path(__file__).resolve().parent
+OUT_DIR = BASE / "data" / "models" / "onnx"
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the query encoder to ONNX for ENCODER_BACKEND=onnx")
+    parser.add_argument("--model", default=MODEL_NAME, help="sentence-transformers model")
+    parser.add_argument("--out", type=Path, default=OUT_DIR, help="Output directory (ONNX_DIR)")
+    parser.add_argument("--quantize", action="store_true", help=f"Also write a dynamic int8 copy ({ONNX_INT8_NAME})")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset (default: 17)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    out = export_onnx(args.model, args.out, quantize=args.quantize, opset=args.opset)
+
+    print("OK")
+    print("onnx:", out / ONNX_NAME)
+    if args.quantize:
+        print("onnx int8:", out / ONNX_INT8_NAME)
+    print("config:", out / CONFIG_NAME)
+    print(f"elapsed: {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Load test of the /diagnose endpoint: replays the test set's queries at
+increasing load and reports throughput, latency percentiles and error rates
+per step.
+
+Closed loop: N users each send a request, wait for the answer and send the
+next one. Open loop: requests arrive at a fixed rate whether or not earlier
+ones have finished; latency counts from the scheduled send time, so a server
+that falls behind is not hidden by a load generator that slows down with it.
+
+Without --endpoint the app runs in-process (no network, same interpreter),
+with both caches disabled unless RESPONSE_CACHE_SIZE / EMBEDDING_CACHE_SIZE
+are set, so repeated queries are not served from cache.
+
+    python loadtest.py -n baseline -d data/test_set --users 1 2 4 8 16
+    python loadtest.py -n baseline -e http://127.0.0.1:8000/diagnose --rate 10 20 50 100
+    python loadtest.py -n after -d data/test_set --users 1 4 16 --baseline data/evals/baseline_load.json
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+@dataclass
+class StepResult:
+    mode: str
+    load: float  # users (closed) or requests/s (open)
+    duration_s: float
+    latencies_s: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    def record(self, latency_s: float, error: str | None):
+        if error is None:
+            self.latencies_s.append(latency_s)
+        else:
+            self.errors[error] += 1
+
+    def summary(self) -> dict:
+        ok = len(self.latencies_s)
+        total = ok + sum(self.errors.values())
+        lat_ms = np.asarray(self.latencies_s) * 1000.0
+        out = {
+            "mode": self.mode,
+            "load": self.load,
+            "duration_s": round(self.duration_s, 3),
+            "requests": total,
+            "ok": ok,
+            "errors": dict(self.errors),
+            "error_rate": round((total - ok) / total, 4) if total else 0.0,
+            "throughput_rps": round(ok / self.duration_s, 2) if self.duration_s else 0.0,
+        }
+        for p in PERCENTILES:
+            out[f"latency_p{p:g}_ms"] = round(float(np.percentile(lat_ms, p)), 3) if ok else None
+        out["latency_max_ms"] = round(float(lat_ms.max()), 3) if ok else None
+        return out
+
+
+def load_queries(dataset_dir: Path, limit: int | None) -> list[str]:
+    files = sorted(dataset_dir.glob("*.json"))[:limit]
+    return [json.loads(f.read_text(encoding="utf-8"))["query"] for f in files]
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, query: str) -> str | None:
+    """One request; returns None on success or the error class ("503", "timeout", ...)."""
+    try:
+        response = await client.post(endpoint, json={"symptoms": query})
+    except httpx.TimeoutException:
+        return "timeout"
+    except httpx.HTTPError as e:
+        return type(e).__name__
+    return None if response.status_code == 200 else str(response.status_code)
+
+
+async def closed_loop(client, endpoint, queries, users: int, duration_s: float, warmup_s: float) -> StepResult:
+    """`users` concurrent clients, each sending its next request as soon as the last one returns."""
+    step = StepResult("closed", users, duration_s)
+    source = itertools.cycle(queries)
+    start = time.perf_counter()
+    measure_from = start + warmup_s
+    deadline = measure_from + duration_s
+
+    async def user():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            error = await send(client, endpoint, next(source))
+            if t0 >= measure_from:
+                step.record(time.perf_counter() - t0, error)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    step.duration_s = time.perf_counter() - measure_from
+    return step
+
+
+async def open_loop(client, endpoint, queries, rate: float, duration_s: float, warmup_s: float) -> StepResult:
+    """Requests scheduled every 1/rate s regardless of completions; latency counts from the schedule."""
+    step = StepResult("open", rate, duration_s)
+    source = itertools.cycle(queries)
+    start = time.perf_counter()
+    n_warmup = int(warmup_s * rate)
+    n_total = n_warmup + int(duration_s * rate)
+
+    async def request(i: int, scheduled: float):
+        error = await send(client, endpoint, next(source))
+        if i >= n_warmup:
+            step.record(time.perf_counter() - scheduled, error)
+
+    tasks = []
+    for i in range(n_total):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(i, scheduled)))
+    await asyncio.gather(*tasks)
+    # until the last answer: a server that falls behind shows up as lower throughput
+    step.duration_s = time.perf_counter() - start - warmup_s
+    return step
+
+
+@contextlib.asynccontextmanager
+async def make_client(endpoint: str | None, timeout_s: float):
+    """An HTTP client for `endpoint`, or one bound to the app in-process (with its lifespan) when None."""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if endpoint is not None:
+        async with httpx.AsyncClient(timeout=timeout_s, limits=limits) as client:
+            yield client, endpoint
+        return
+
+    os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+    os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+    from src.api.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://app", timeout=timeout_s, limits=limits
+        ) as client:
+            yield client, "/diagnose"
+
+
+async def run_load(args, queries: list[str], console: Console) -> list[dict]:
+    mode, loads = ("open", args.rate) if args.rate else ("closed", args.users)
+    steps = []
+    async with make_client(args.endpoint, args.timeout) as (client, endpoint):
+        for load in loads:
+            if mode == "open":
+                step = await open_loop(client, endpoint, queries, load, args.duration, args.warmup)
+            else:
+                step = await closed_loop(client, endpoint, queries, int(load), args.duration, args.warmup)
+            summary = step.summary()
+            steps.append(summary)
+            console.print(
+                f"[cyan]{mode} {load:g}[/cyan]: {summary['throughput_rps']} req/s, "
+                f"p99 {summary['latency_p99_ms']} ms, errors {summary['error_rate']:.1%}"
+            )
+            if summary["error_rate"] > args.stop_error_rate:
+                console.print(f"[yellow]error rate above {args.stop_error_rate:.0%}, stopping the ramp[/yellow]")
+                break
+    return steps
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(steps: list[dict], baseline: dict, threshold: float) -> list[str]:
+    """Steps whose throughput dropped, or p99 grew, by more than `threshold` against the baseline run."""
+    base = {(s["mode"], s["load"]): s for s in baseline["steps"]}
+    regressions = []
+    for s in steps:
+        b = base.get((s["mode"], s["load"]))
+        if b is None or not b["ok"] or not s["ok"]:
+            continue
+        if s["throughput_rps"] < b["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{s['mode']} {s['load']:g}: throughput {b['throughput_rps']} -> {s['throughput_rps']} req/s")
+        if s["latency_p99_ms"] > b["latency_p99_ms"] * (1 + threshold):
+            regressions.append(f"{s['mode']} {s['load']:g}: p99 {b['latency_p99_ms']} -> {s['latency_p99_ms']} ms")
+    return regressions
+
+
+def display_steps(steps: list[dict], console: Console):
+    table = Table(
+        title="[bold]Load Test[/bold]",
+        show_header=True,
+        header_style="bold magenta",
+        border_style="cyan",
+    )
+    for col in ("Load", "Requests", "Req/s", "p50 ms", "p95 ms", "p99 ms", "p99.9 ms", "Errors"):
+        table.add_column(col, style="green" if col != "Load" else "cyan", justify="right")
+    for s in steps:
+        unit = "users" if s["mode"] == "closed" else "req/s"
+        table.add_row(
+            f"{s['load']:g} {unit}",
+            str(s["requests"]),
+            f"{s['throughput_rps']:.1f}",
+            *(f"{s[f'latency_p{p:g}_ms']}" for p in PERCENTILES),
+            f"{s['error_rate']:.2%}" + (f" {s['errors']}" if s["errors"] else ""),
+        )
+    console.print()
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of the diagnostic endpoint",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("-n", "--name", required=True, help="Run name (used for output file naming)")
+    parser.add_argument("-e", "--endpoint", default=None, help="URL of the diagnostic endpoint (default: the app in-process)")
+    parser.add_argument("-d", "--dataset-dir", type=Path, default=Path("data/test_set"), help="Directory containing JSON protocol files")
+    parser.add_argument("-l", "--limit", type=int, default=None, help="Replay only the first N queries (default: all)")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Closed loop: concurrent users per step")
+    load.add_argument("--rate", type=float, nargs="+", default=None, help="Open loop: arrival rate (req/s) per step")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per step")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds at the start of each step")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--stop-error-rate", type=float, default=0.5, help="Stop the ramp once a step's error rate exceeds this")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Tolerated relative drop in throughput / rise in p99")
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("data/evals"), help="Output directory (default: data/evals)")
+    args = parser.parse_args()
+    console = Console()
+
+    queries = load_queries(args.dataset_dir, args.limit)
+    if not queries:
+        console.print(f"[red]No JSON files found in {args.dataset_dir}[/red]")
+        return 1
+
+    steps = asyncio.run(run_load(args, queries, console))
+    display_steps(steps, console)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    output_json = args.output_dir / f"{args.name}_load.json"
+    report = {
+        "name": args.name,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "endpoint": args.endpoint or "in-process",
+        "queries": len(queries),
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "steps": steps,
+    }
+    with open(output_json, "w") as f:
+        json.dump(report, f, indent=2)
+    console.print(f"[green]✓[/green] Results saved to: [bold cyan]{output_json}[/bold cyan]")
+
+    if args.baseline:
+        regressions = compare(steps, json.loads(args.baseline.read_text()), args.max_regression)
+        for line in regressions:
+            console.print(f"[red]regression[/red] {line}")
+        if regressions:
+            return 1
+        console.print(f"[green]no regression against {args.baseline}[/green]")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,16 +1,351 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
-from src.engine.retrieve import retrieve
+from src.core.diagnosis_engine import build_diagnoses
+from src.engine.async_engine import AsyncEngine, Overloaded
+from src.engine.batcher import BatcherStopped, MicroBatcher
+from src.engine.cache import cache_from_env, normalize_query
+from src.engine.metrics import HistogramVec, Timings, prometheus_family
+from src.engine.rerank import reranker, score_cache
+from src.engine.retrieve import (
+    IndexWatcher,
+    embedding_cache,
+    index_info,
+    index_version,
+    is_loaded,
+    reload,
+    retrieve_many,
+    warmup,
+)
+
+log = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+TOP_K = 3
+# retrieval candidates handed to the rule engine before the final top-K cut
+RETRIEVE_TOP_K = int(os.getenv("RETRIEVE_TOP_K", "10"))
+# poll INDEX_DIR/CURRENT every N seconds and hot-swap new versions; 0 disables
+INDEX_WATCH_INTERVAL_S = float(os.getenv("INDEX_WATCH_INTERVAL_S", "0"))
+# required in X-Admin-Token for /admin/*; unset: /admin/* is disabled
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# block: load encoder + index before accepting requests; background: load while
+# already serving /health and /docs; off: load on the first /diagnose
+WARMUP = os.getenv("WARMUP", "block")
+
+# CPU-bound stages run on the engine's own thread pool, each with a concurrency limit;
+# beyond MAX_BACKLOG queries in flight, new work gets 503 + Retry-After
+engine = AsyncEngine(
+    limits={
+        "encode": int(os.getenv("ENCODE_CONCURRENCY", "1")),
+        "search": int(os.getenv("SEARCH_CONCURRENCY", "2")),
+        "rules": int(os.getenv("RULES_CONCURRENCY", "2")),
+    },
+    threads=int(os.getenv("ENGINE_THREADS", "0")),
+    max_backlog=int(os.getenv("MAX_BACKLOG", "1024")),
+    retry_after_s=float(os.getenv("RETRY_AFTER_S", "1")),
+)
+
+
+# per-stage time of every engine call, and end-to-end time per endpoint
+stage_seconds = HistogramVec()
+request_seconds = HistogramVec()
+
+
+def apply_rules(
+    queries: List[str], retrieved: List[List[Dict]], timings: Optional[Timings] = None
+) -> List[List[Dict]]:
+    """The rule engine per query over its retrieval candidates."""
+    timings = timings if timings is not None else Timings()
+    with timings.stage("rules"):
+        return _apply_rules(queries, retrieved)
+
+
+def _apply_rules(queries: List[str], retrieved: List[List[Dict]]) -> List[List[Dict]]:
+    return [
+        [
+            {
+                "rank": rank,
+                "diagnosis": c["name"],
+                "icd10_code": c["icd10_code"],
+                "explanation": "; ".join(c["evidence"]),
+            }
+            for rank, c in enumerate(build_diagnoses(q, r, top_k=TOP_K), start=1)
+        ]
+        for q, r in zip(queries, retrieved)
+    ]
+
+
+def diagnose_many(queries: List[str]) -> List[List[Dict]]:
+    """Retrieval for the whole batch, then the rule engine per query."""
+    return apply_rules(queries, retrieve_many(queries, top_k=RETRIEVE_TOP_K))
+
+
+async def diagnose_many_async(queries: List[str], timings: Timings) -> List[List[Dict]]:
+    """diagnose_many() through the engine's stages; the event loop only schedules."""
+    retrieved = await engine.retrieve_many(queries, top_k=RETRIEVE_TOP_K, timings=timings)
+    results = await engine.run("rules", apply_rules, queries, retrieved, timings, timings=timings)
+    stage_seconds.observe_timings(timings)
+    return results
+
+
+async def _diagnose_batch(queries: List[str]) -> List[Tuple[List[Dict], Timings]]:
+    """Micro-batch entry point: every request of the batch shares the batch's timings."""
+    timings = Timings()
+    results = await diagnose_many_async(queries, timings)
+    return [(r, timings) for r in results]
+
+
+# concurrent /diagnose calls are coalesced into one encode + search
+batcher = MicroBatcher(
+    _diagnose_batch,
+    max_batch_size=int(os.getenv("MICROBATCH_MAX_SIZE", "32")),
+    max_wait_ms=float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5")),
+    max_inflight=int(os.getenv("MICROBATCH_MAX_INFLIGHT", "2")),
+)
+
+# normalized symptom text -> final diagnoses
+response_cache = cache_from_env("RESPONSE_CACHE", maxsize=10_000, ttl_s=600)
+
+# WARMUP=background: the warmup run, kept so a failure is logged and shown by /health
+warmup_future: Optional[asyncio.Future] = None
+
+
+def _warmup_done(fut: asyncio.Future) -> None:
+    if not fut.cancelled() and fut.exception() is not None:
+        log.error("Background warmup failed", exc_info=fut.exception())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup_future
+    # load the prebuilt index once at startup, not inside the first request
+    if WARMUP == "block":
+        warmup()
+    elif WARMUP == "background":
+        warmup_future = asyncio.get_running_loop().run_in_executor(None, warmup)
+        warmup_future.add_done_callback(_warmup_done)
+    engine.start()
+    batcher.start()
+    watcher = IndexWatcher(INDEX_WATCH_INTERVAL_S) if INDEX_WATCH_INTERVAL_S > 0 else None
+    if watcher:
+        watcher.start()
+    yield
+    if watcher:
+        watcher.stop()
+    await batcher.stop()
+    engine.stop()
+
+
+app = FastAPI(title="Medical Diagnosis Assistant", lifespan=lifespan)
+
+
+@app.exception_handler(BatcherStopped)
+async def batcher_stopped(request: Request, exc: BatcherStopped):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
-app = FastAPI(title="Medical Diagnosis Assistant")
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after_s))},
+    )
+
+
+async def _index_version() -> str:
+    # the first request with WARMUP=off loads the index: not on the event loop
+    return index_version() if is_loaded() else await engine.run("search", index_version)
 
 
 class QueryRequest(BaseModel):
     symptoms: str
 
 
+class BatchQueryRequest(BaseModel):
+    symptoms: List[str]
+
+
+def _finish(endpoint: str, t0: float, timings: Optional[Timings], debug: bool, response: Response) -> int:
+    """Records the request and returns its latency in ms; with `debug`, adds a Server-Timing breakdown."""
+    elapsed = time.perf_counter() - t0
+    request_seconds.observe(endpoint, elapsed)
+    if debug:
+        parts = [f"{stage};dur={ms}" for stage, ms in (timings.ms() if timings else {}).items()]
+        parts.append(f"cache;desc={'miss' if timings else 'hit'}")
+        parts.append(f"total;dur={elapsed * 1000.0:.3f}")
+        response.headers["Server-Timing"] = ", ".join(parts)
+    return round(elapsed * 1000.0)
+
+
 @app.post("/diagnose")
-def diagnose(req: QueryRequest):
-    diagnoses = retrieve(req.symptoms, top_k=3)
-    return {"diagnoses": diagnoses}
\ No newline at end of file
+async def diagnose(
+    req: QueryRequest,
+    response: Response,
+    x_debug_timings: Optional[str] = Header(default=None),
+):
+    t0 = time.perf_counter()
+    key = normalize_query(req.symptoms)
+    version = await _index_version()
+    diagnoses = response_cache.get(key, version=version)
+    timings = None
+    if diagnoses is None:
+        with engine.admit(1):
+            diagnoses, timings = await batcher.submit(req.symptoms)
+        response_cache.put(key, diagnoses, version=version)
+    latency_ms = _finish("/diagnose", t0, timings, bool(x_debug_timings), response)
+    return {"diagnoses": diagnoses, "latency_ms": latency_ms}
+
+
+@app.post("/diagnose/batch")
+async def diagnose_batch(
+    req: BatchQueryRequest,
+    response: Response,
+    x_debug_timings: Optional[str] = Header(default=None),
+):
+    t0 = time.perf_counter()
+    if len(req.symptoms) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(req.symptoms)} > {MAX_BATCH_SIZE}",
+        )
+    version = await _index_version()
+    keys = [normalize_query(s) for s in req.symptoms]
+    results = [response_cache.get(k, version=version) for k in keys]
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    timings = None
+    if missing:
+        timings = Timings()
+        with engine.admit(len(missing)):
+            fresh = await diagnose_many_async([req.symptoms[i] for i in missing], timings)
+        for i, diagnoses in zip(missing, fresh):
+            results[i] = diagnoses
+            response_cache.put(keys[i], diagnoses, version=version)
+
+    latency_ms = _finish("/diagnose/batch", t0, timings, bool(x_debug_timings), response)
+    return {"results": [{"diagnoses": diagnoses} for diagnoses in results], "latency_ms": latency_ms}
+
+
+@app.get("/stats/batcher")
+def batcher_stats():
+    return batcher.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition."""
+    engine_stats = engine.stats()
+    batcher_stats = batcher.stats()
+    caches = {
+        "response": response_cache.stats(),
+        "embedding": embedding_cache.stats(),
+        "rerank": score_cache.stats(),
+    }
+    stages = engine_stats["stages"]
+    lines = []
+    lines += prometheus_family(
+        "diagnosis_stage_seconds", "histogram", "Time per engine call spent in each stage",
+        [({"stage": stage}, h) for stage, h in stage_seconds.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_request_seconds", "histogram", "End-to-end request latency",
+        [({"endpoint": endpoint}, h) for endpoint, h in request_seconds.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_microbatch_size", "histogram", "Requests per micro-batch",
+        [({}, batcher.batch_sizes)],
+    )
+    lines += prometheus_family(
+        "diagnosis_microbatch_queue_depth", "gauge", "Requests waiting for a micro-batch",
+        [({}, batcher_stats["queue_depth"])],
+    )
+    lines += prometheus_family(
+        "diagnosis_engine_backlog", "gauge", "Queries admitted and not finished",
+        [({}, engine_stats["backlog"])],
+    )
+    lines += prometheus_family(
+        "diagnosis_engine_rejected_total", "counter", "Requests rejected with 503 by admission control",
+        [({}, engine_stats["rejected"])],
+    )
+    lines += prometheus_family(
+        "diagnosis_engine_stage_running", "gauge", "Engine calls running per stage",
+        [({"stage": name}, s["running"]) for name, s in stages.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_engine_stage_waiting", "gauge", "Engine calls waiting for a stage slot",
+        [({"stage": name}, s["waiting"]) for name, s in stages.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_rerank_queries_total", "counter", "Queries reranked by the cross-encoder or left in bi-encoder order",
+        [({"outcome": "reranked"}, reranker.reranked), ({"outcome": "fallback"}, reranker.fallbacks)],
+    )
+    lines += prometheus_family(
+        "diagnosis_cache_hits_total", "counter", "Cache hits",
+        [({"cache": name}, c["hits"]) for name, c in caches.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_cache_misses_total", "counter", "Cache misses",
+        [({"cache": name}, c["misses"]) for name, c in caches.items()],
+    )
+    lines += prometheus_family(
+        "diagnosis_cache_entries", "gauge", "Cache entries",
+        [({"cache": name}, c["size"]) for name, c in caches.items()],
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/engine")
+def engine_stats():
+    return engine.stats()
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return {
+        "response": response_cache.stats(),
+        "embedding": embedding_cache.stats(),
+        "rerank": score_cache.stats(),
+    }
+
+
+@app.get("/stats/rerank")
+def rerank_stats():
+    return reranker.stats()
+
+
+@app.get("/health")
+def health():
+    """Liveness; never loads the model or the index. Shows why a background warmup failed."""
+    status = {"status": "ok", "ready": is_loaded()}
+    fut = warmup_future
+    if fut is not None and fut.done() and not fut.cancelled() and fut.exception() is not None:
+        status["warmup_error"] = repr(fut.exception())
+    return status
+
+
+@app.get("/index")
+def index_status():
+    return {"version": index_version(), "index": index_info()}
+
+
+@app.post("/admin/reload")
+def admin_reload(force: bool = False, x_admin_token: str | None = Header(default=None)):
+    """Swap to the version CURRENT points at; in-flight requests finish on the old one."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        return reload(force=force)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
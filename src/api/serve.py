@@ -0,0 +1,119 @@
+"""
+Pre-fork server for the API.
+
+The supervisor maps the served index once, then forks the workers, so every
+worker shares those pages instead of loading its own copy (`uvicorn --workers`
+starts fresh interpreters that each load everything). Each worker loads its own
+encoder after the fork:
+
+    python -m src.api.serve --host 0.0.0.0 --port 8000 --workers 8
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Set
+
+import uvicorn
+
+log = logging.getLogger("serve")
+
+
+def _bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker(sock: socket.socket, log_level: str) -> None:
+    # own process group: a terminal Ctrl-C reaches only the supervisor, which stops workers once
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from src.api.main import app
+
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _worker(sock, log_level)
+        except BaseException:
+            log.exception("worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _preload():
+    """
+    Maps the served index in the supervisor, for the workers to share copy-on-write.
+    The encoder is left to each worker (its startup warmup, else the first query):
+    torch and ONNX Runtime set up thread pools and allocator state on load that
+    do not survive a fork.
+    """
+    from src.engine import retrieve
+    import src.api.main  # noqa: F401
+
+    return retrieve.current()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1)),
+        help="Worker processes (default: SERVE_WORKERS, else all cores)",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+
+    snap = _preload()
+    log.info("index %s (%s) mapped, forking %d workers", snap.path.name, snap.version, args.workers)
+
+    sock = _bind(args.host, args.port)
+    workers: Set[int] = {_spawn(sock, args.log_level) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            log.warning("worker %d exited with status %d, restarting", pid, status)
+            time.sleep(1.0)
+            if not stopping:
+                workers.add(_spawn(sock, args.log_level))
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
-from typing import List, Dict
-import math
+from typing import List, Dict, FrozenSet, Tuple
+import re
+
+from src.engine.icd import icd_category
 
 
 SYMPTOM_HINTS = {
@@ -17,19 +19,86 @@ BAD_CONTEXT = {
     "острый живот": ["астма", "анафилак"],
 }
 
+# checked in order, first hit wins
+CONTEXT_TRIGGERS = [
+    ("неврология", ["перекос", "речь", "слабость"]),
+    ("острый живот", ["живот", "тошнота", "рвота"]),
+]
+
+EMERGENCY_SIGNS = ["перекос", "нарушение речи"]
+EMERGENCY_ONSET = ["внезап"]
+
+# checked in order, first hit wins; DEFAULT_FALLBACK otherwise
+FALLBACK_POOLS = [
+    (["кашель", "температур", "мокрот"], [
+        ("Внебольничная пневмония", "J18"),
+        ("Острый бронхит", "J20"),
+        ("ОРВИ", "J06"),
+    ]),
+    (["живот", "правой нижн"], [
+        ("Острый аппендицит", "K35"),
+        ("Гастроэнтерит", "A09"),
+        ("Кишечная колика", "K59"),
+    ]),
+    (["беремен", "давление"], [
+        ("Преэклампсия", "O14"),
+        ("HELLP-синдром", "O14"),
+        ("Гипертензия при беременности", "O10"),
+    ]),
+]
+
+DEFAULT_FALLBACK = [
+    ("Артериальная гипертензия", "I10"),
+    ("Астенический синдром", "R53"),
+    ("Вегетативная дисфункция", "G90"),
+]
+
+
+def _compile_matcher(patterns: List[str]) -> Tuple[re.Pattern, Dict[str, FrozenSet[str]]]:
+    """
+    One regex for every rule pattern. The lookahead reports a match at every
+    position (longest alternative first); `implied` adds the patterns contained
+    in a reported one, e.g. "перекос лица" implies "перекос".
+    Together they give exactly the set of patterns occurring in the text.
+    """
+    patterns = sorted(set(patterns), key=len, reverse=True)
+    regex = re.compile("(?=(" + "|".join(re.escape(p) for p in patterns) + "))")
+    implied = {p: frozenset(q for q in patterns if q in p) for p in patterns}
+    return regex, implied
+
+
+_QUERY_PATTERNS = (
+    list(SYMPTOM_HINTS)
+    + [w for _, words in CONTEXT_TRIGGERS for w in words]
+    + EMERGENCY_SIGNS
+    + EMERGENCY_ONSET
+    + [w for words, _ in FALLBACK_POOLS for w in words]
+)
+_QUERY_RE, _IMPLIED = _compile_matcher(_QUERY_PATTERNS)
+
+_BAD_CONTEXT_RE = {
+    context: re.compile("|".join(re.escape(w) for w in words))
+    for context, words in BAD_CONTEXT.items()
+}
+
 
-def detect_context(query: str) -> str:
-    q = query.lower()
-    if any(w in q for w in ["перекос", "речь", "слабость"]):
-        return "неврология"
-    if any(w in q for w in ["живот", "тошнота", "рвота"]):
-        return "острый живот"
+def scan(query: str) -> FrozenSet[str]:
+    """All rule patterns present in the query, found in a single pass."""
+    found = set()
+    for m in _QUERY_RE.finditer(query.lower()):
+        found |= _IMPLIED[m.group(1)]
+    return frozenset(found)
+
+
+def detect_context(matches: FrozenSet[str]) -> str:
+    for context, words in CONTEXT_TRIGGERS:
+        if any(w in matches for w in words):
+            return context
     return "general"
 
 
-def emergency_override(query: str) -> List[Dict] | None:
-    q = query.lower()
-    if ("перекос" in q or "нарушение речи" in q) and "внезап" in q:
+def emergency_override(matches: FrozenSet[str]) -> List[Dict] | None:
+    if any(w in matches for w in EMERGENCY_SIGNS) and any(w in matches for w in EMERGENCY_ONSET):
         return [
             {
                 "name": "Ишемический инсульт",
@@ -56,24 +125,27 @@ def emergency_override(query: str) -> List[Dict] | None:
     return None
 
 
-def apply_boosting(query: str, c: Dict) -> float:
-    boost = 0.0
-    q = query.lower()
-    for kw, codes in SYMPTOM_HINTS.items():
-        if kw in q and c["icd10_code"] in codes:
-            boost += 0.15
-    return boost
+def hint_boosts(matches: FrozenSet[str]) -> Dict[str, float]:
+    """ICD category -> boost from the symptom hints present in the query."""
+    boosts: Dict[str, float] = {}
+    for kw in matches:
+        for code in SYMPTOM_HINTS.get(kw, ()):
+            boosts[code] = boosts.get(code, 0.0) + 0.15
+    return boosts
+
+
+def apply_boosting(boosts: Dict[str, float], c: Dict) -> float:
+    return boosts.get(icd_category(c["icd10_code"]), 0.0)
 
 
 def is_blacklisted(context: str, name: str) -> bool:
-    name = name.lower()
-    for bad in BAD_CONTEXT.get(context, []):
-        if bad in name:
-            return True
-    return False
+    bad = _BAD_CONTEXT_RE.get(context)
+    return bool(bad and bad.search(name.lower()))
 
 
 def normalize_confidence(cands: List[Dict]) -> None:
+    if not cands:
+        return
     max_score = max(c["score"] for c in cands) or 1.0
     for c in cands:
         c["confidence"] = round(c["score"] / max_score, 2)
@@ -86,13 +158,17 @@ def build_diagnoses(
     top_k: int = 3,
 ) -> List[Dict]:
 
+    # 0. One pass over the query for every rule
+    matches = scan(query)
+
     # 1. Emergency
-    emergency = emergency_override(query)
+    emergency = emergency_override(matches)
     if emergency:
         normalize_confidence(emergency)
         return emergency[:top_k]
 
-    context = detect_context(query)
+    context = detect_context(matches)
+    boosts = hint_boosts(matches)
     candidates = []
 
     # 2. Retrieval + rules
@@ -104,14 +180,14 @@ def build_diagnoses(
             continue
 
         score = r.get("score", 0.5)
-        score += apply_boosting(query, r)
+        score += apply_boosting(boosts, r)
 
         candidates.append({
             "name": r["diagnosis"],
             "icd10_code": r["icd10_code"],
             "protocol_id": r.get("protocol_id", "unknown"),
             "score": score,
-            "evidence": r.get("evidence", []),
+            "evidence": r.get("evidence") or ([r["explanation"]] if r.get("explanation") else []),
         })
 
     # 3. Sort
@@ -119,7 +195,7 @@ def build_diagnoses(
 
     # 4. Fallback if < K
     if len(candidates) < top_k:
-        candidates.extend(contextual_fallback(query, candidates))
+        candidates.extend(contextual_fallback(matches, candidates))
 
     # 5. Cut + normalize
     candidates = candidates[:top_k]
@@ -127,35 +203,14 @@ def build_diagnoses(
     return candidates
 
 
-def contextual_fallback(query: str, used: List[Dict]) -> List[Dict]:
-    q = query.lower()
+def contextual_fallback(matches: FrozenSet[str], used: List[Dict]) -> List[Dict]:
     used_codes = {c["icd10_code"] for c in used}
-    pool = []
 
-    if any(w in q for w in ["кашель", "температур", "мокрот"]):
-        pool = [
-            ("Внебольничная пневмония", "J18"),
-            ("Острый бронхит", "J20"),
-            ("ОРВИ", "J06"),
-        ]
-    elif any(w in q for w in ["живот", "правой нижн"]):
-        pool = [
-            ("Острый аппендицит", "K35"),
-            ("Гастроэнтерит", "A09"),
-            ("Кишечная колика", "K59"),
-        ]
-    elif any(w in q for w in ["беремен", "давление"]):
-        pool = [
-            ("Преэклампсия", "O14"),
-            ("HELLP-синдром", "O14"),
-            ("Гипертензия при беременности", "O10"),
-        ]
-    else:
-        pool = [
-            ("Артериальная гипертензия", "I10"),
-            ("Астенический синдром", "R53"),
-            ("Вегетативная дисфункция", "G90"),
-        ]
+    pool = DEFAULT_FALLBACK
+    for words, candidates in FALLBACK_POOLS:
+        if any(w in matches for w in words):
+            pool = candidates
+            break
 
     out = []
     for name, code in pool:
@@ -167,4 +222,4 @@ def contextual_fallback(query: str, used: List[Dict]) -> List[Dict]:
                 "score": 0.4,
                 "evidence": ["Контекстный fallback"],
             })
-    return out
\ No newline at end of file
+    return out
@@ -0,0 +1,137 @@
+import time
+from typing import Dict
+
+import faiss
+import numpy as np
+
+ANN_NAME = "ann.faiss"
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "fp16", "int8")
+
+# build- and search-time tunables per index type
+DEFAULT_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": 1024, "nprobe": 16},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 128},
+    "ivfpq": {"nlist": 1024, "nprobe": 32, "pq_m": 48, "pq_nbits": 8},
+    # quantized copies of the corpus matrix, scanned exhaustively:
+    # fp16 halves it, int8 (per-dimension min/scale) quarters it
+    "fp16": {},
+    "int8": {},
+}
+
+# types that hold every vector, decodable on their own: such a version can be
+# built without the float32 copy (build_index.py --no-float32)
+QUANTIZED_TYPES = ("fp16", "int8")
+
+# params applied with faiss.ParameterSpace at load time
+SEARCH_PARAMS = ("nprobe", "efSearch")
+
+# faiss recommends 39..256 training points per IVF centroid
+_MIN_POINTS_PER_CENTROID = 39
+_MAX_POINTS_PER_CENTROID = 256
+# sample for the per-dimension ranges of int8
+_SQ_TRAIN_SIZE = 262144
+
+
+def flat_vectors(index) -> np.ndarray:
+    """
+    Zero-copy (ntotal, d) float32 view over the vectors of a flat index.
+    With a memory-mapped index the view points straight at the mapped pages.
+    """
+    flat = faiss.downcast_index(index)
+    if isinstance(flat, faiss.IndexIDMap):
+        # ID-mapped (incrementally updated) index: positions follow metadata order
+        flat = faiss.downcast_index(flat.index)
+    if not isinstance(flat, faiss.IndexFlat):
+        raise RuntimeError(f"Expected a flat FAISS index, got {type(flat).__name__}")
+    buf = faiss.rev_swig_ptr(flat.codes.data(), flat.ntotal * flat.code_size)
+    return buf.view(np.float32).reshape(flat.ntotal, flat.d)
+
+
+def resolve_params(index_type: str, n: int, overrides: Dict) -> Dict:
+    params = {**DEFAULT_PARAMS[index_type], **{k: v for k, v in overrides.items() if v is not None}}
+    if "nlist" in params:
+        params["nlist"] = max(1, min(params["nlist"], n // _MIN_POINTS_PER_CENTROID))
+        params["nprobe"] = min(params["nprobe"], params["nlist"])
+    return params
+
+
+def set_search_params(index, params: Dict) -> None:
+    ps = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS:
+        if name in params:
+            ps.set_index_parameter(index, name, params[name])
+
+
+def build_ann(xb: np.ndarray, index_type: str, params: Dict, shard_size: int = 65536):
+    """
+    ANN (or quantized) index over xb whose labels are row positions of xb (= metadata order).
+    Trained on a sample of xb, then filled shard by shard.
+    """
+    d = xb.shape[1]
+    if index_type == "ivfpq" and d % params["pq_m"]:
+        raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {d}")
+    if index_type == "ivf":
+        key = f"IVF{params['nlist']},Flat"
+    elif index_type == "hnsw":
+        key = f"HNSW{params['M']},Flat"
+    elif index_type == "ivfpq":
+        key = f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    elif index_type == "fp16":
+        key = "SQfp16"
+    elif index_type == "int8":
+        key = "SQ8"
+    else:
+        raise ValueError(f"Not an ANN index type: {index_type}")
+
+    index = faiss.index_factory(d, key, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = params["efConstruction"]
+    if not index.is_trained:
+        limit = params["nlist"] * _MAX_POINTS_PER_CENTROID if "nlist" in params else _SQ_TRAIN_SIZE
+        n_train = min(len(xb), limit)
+        pick = np.sort(np.random.default_rng(0).choice(len(xb), size=n_train, replace=False))
+        index.train(np.ascontiguousarray(xb[pick]))
+    for start in range(0, len(xb), shard_size):
+        index.add(np.ascontiguousarray(xb[start : start + shard_size]))
+    set_search_params(index, params)
+    return index
+
+
+def recall_report(flat, ann, k: int = 20, n_queries: int = 200, seed: int = 0) -> Dict:
+    """
+    Recall@k and single-query latency of `ann` against exact search on `flat`
+    (the build's flat index; positions are the labels of both).
+    Queries are perturbed corpus vectors, so they are near, but not in, the index.
+    """
+    xb = flat_vectors(flat)
+    exact = faiss.downcast_index(flat)
+    if isinstance(exact, faiss.IndexIDMap):
+        exact = faiss.downcast_index(exact.index)
+
+    rng = np.random.default_rng(seed)
+    n = len(xb)
+    k = min(k, n)
+    pick = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = xb[pick] + rng.normal(scale=0.05, size=(len(pick), xb.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def timed(index):
+        out = []
+        t0 = time.perf_counter()
+        for q in queries:
+            out.append(index.search(q[None, :], k)[1][0])
+        return np.stack(out), (time.perf_counter() - t0) / len(queries) * 1000.0
+
+    truth, flat_ms = timed(exact)
+    found, ann_ms = timed(ann)
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall": round(float(recall), 4),
+        "flat_latency_ms": round(flat_ms, 4),
+        "ann_latency_ms": round(ann_ms, 4),
+        "speedup": round(flat_ms / ann_ms, 2) if ann_ms else None,
+    }
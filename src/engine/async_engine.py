@@ -0,0 +1,147 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.engine import retrieve
+from src.engine.metrics import Timings
+
+
+class Overloaded(Exception):
+    """The backlog is above the admission threshold; the caller should retry later."""
+
+    def __init__(self, backlog: int, max_backlog: int, retry_after_s: float):
+        super().__init__(f"Server overloaded: {backlog} queries in flight (limit {max_backlog})")
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self.retry_after_s = retry_after_s
+
+
+class Stage:
+    """A pipeline stage: at most `limit` calls run at once, the rest wait on the event loop."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def start(self) -> None:
+        # created on the serving loop
+        self._sem = asyncio.Semaphore(self.limit)
+
+    async def run(
+        self, executor: ThreadPoolExecutor, fn: Callable, *args, timings: Optional[Timings] = None
+    ) -> Any:
+        self.waiting += 1
+        t0 = time.perf_counter()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        if timings is not None:
+            timings.add("queue", time.perf_counter() - t0)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._sem.release()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+        }
+
+
+class AsyncEngine:
+    """
+    Async front of the retrieval engine. CPU-bound stages run on a dedicated
+    thread pool (the encoder, NumPy and FAISS release the GIL), each under its
+    own concurrency limit, so the event loop only schedules. Admission control
+    rejects work up front once `max_backlog` queries are in the system, instead
+    of letting every request queue until it times out.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        threads: int = 0,
+        max_backlog: int = 1024,
+        retry_after_s: float = 1.0,
+    ):
+        self.stages = {name: Stage(name, n) for name, n in limits.items()}
+        # one thread per stage slot: a stage that got its permit never waits for a thread
+        self.threads = threads or sum(limits.values())
+        self.max_backlog = max_backlog
+        self.retry_after_s = retry_after_s
+        self.backlog = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="engine")
+            for stage in self.stages.values():
+                stage.start()
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @contextmanager
+    def admit(self, n: int = 1) -> Iterator[None]:
+        """
+        Counts `n` queries into the backlog for the duration of the block, or
+        raises Overloaded. A request larger than the whole threshold is still
+        admitted when nothing else is in flight.
+        """
+        if self.max_backlog and self.backlog and self.backlog + n > self.max_backlog:
+            self.rejected += 1
+            raise Overloaded(self.backlog, self.max_backlog, self.retry_after_s)
+        self.backlog += n
+        try:
+            yield
+        finally:
+            self.backlog -= n
+
+    async def run(self, stage: str, fn: Callable, *args, timings: Optional[Timings] = None) -> Any:
+        """fn(*args) on the engine's pool under `stage`'s limit; the wait for a slot counts as "queue"."""
+        if self._executor is None:
+            raise RuntimeError("AsyncEngine is not started")
+        return await self.stages[stage].run(self._executor, fn, *args, timings=timings)
+
+    async def retrieve_many(
+        self, queries: List[str], top_k: int = 3, timings: Optional[Timings] = None
+    ) -> List[List[Dict]]:
+        """retrieve.retrieve_many() with encode and search as separate stages."""
+        if not queries:
+            return []
+        timings = timings if timings is not None else Timings()
+        snap = await self.run("search", retrieve.current)
+
+        def encode():
+            with timings.stage("encode"):
+                return retrieve.encode_queries(queries, snap.version)
+
+        q_embs = await self.run("encode", encode, timings=timings)
+        return await self.run(
+            "search", retrieve.search_many, snap, queries, q_embs, top_k, timings, timings=timings
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "threads": self.threads,
+            "backlog": self.backlog,
+            "max_backlog": self.max_backlog,
+            "rejected": self.rejected,
+            "stages": {name: s.stats() for name, s in self.stages.items()},
+        }
@@ -0,0 +1,157 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.engine.metrics import Histogram, pow2_buckets
+
+
+class BatcherStopped(RuntimeError):
+    """The batcher was stopped (shutdown) before the request was dispatched; the caller should retry."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item requests for up to `max_wait_ms` or
+    `max_batch_size` items, runs `fn` once on the whole batch and resolves
+    every caller's future with its own result.
+
+    `fn` takes a list of payloads and returns a list of results in the same
+    order. A coroutine function is awaited, with up to `max_inflight` batches
+    running at once (so one batch can encode while the previous one searches);
+    a plain function runs in the default executor, one batch at a time.
+    On stop(), requests not yet dispatched fail with BatcherStopped.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_inflight: int = 2,
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.is_async = asyncio.iscoroutinefunction(fn)
+        self.max_inflight = max_inflight if self.is_async else 1
+
+        self.batch_sizes = Histogram(pow2_buckets(max_batch_size))
+        self.queue_depths = Histogram([0] + pow2_buckets(max_batch_size * 8))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Set[asyncio.Task] = set()
+        # the batch _run is filling: taken off the queue, not dispatched yet
+        self._collecting: List[Tuple[Any, asyncio.Future]] = []
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_inflight)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # requests not dispatched yet would never be answered
+        pending, self._collecting = self._collecting, []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, fut in pending:
+            if not fut.done():
+                fut.set_exception(BatcherStopped("Server is shutting down"))
+        # batches already dispatched finish and answer their callers
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, payload: Any) -> Any:
+        if self._task is None:
+            raise RuntimeError("MicroBatcher is not started")
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((payload, fut))
+        return await fut
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        # kept on self so stop() can answer a batch cancelled half-collected
+        self._collecting = batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._collecting = []
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # the next batch keeps filling while all slots are busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # callers that went away (client disconnect) are dropped before the encode
+            batch = [(p, f) for p, f in batch if not f.done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            self.batch_sizes.observe(len(batch))
+            self.queue_depths.observe(self._queue.qsize())
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        payloads = [p for p, _ in batch]
+        try:
+            if self.is_async:
+                results = await self.fn(payloads)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(None, self.fn, payloads)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+        if len(results) != len(batch):
+            error = RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} payloads")
+            for _, fut in batch[len(results) :]:
+                if not fut.done():
+                    fut.set_exception(error)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_inflight": self.max_inflight,
+            "inflight": len(self._inflight),
+            "queue_depth": self.queue_depth,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_depth_at_dispatch": self.queue_depths.snapshot(),
+        }
@@ -0,0 +1,162 @@
+import bisect
+import json
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.engine.columnar import (
+    SpillBuffer,
+    StringColumn,
+    csr_layout,
+    csr_ptr,
+    load_string_column,
+    open_array,
+    write_string_column,
+)
+from src.engine.stemmer import ANALYZER_VERSION, analyze
+
+log = logging.getLogger(__name__)
+
+# <version dir>/bm25/: the lexical index next to the vectors
+BM25_DIR = "bm25"
+K1 = 1.2
+B = 0.75
+
+
+class BM25Writer:
+    """
+    Builds the BM25 inverted index of a version while the build streams
+    metadata records. Postings are CSR arrays over the sorted stem vocabulary;
+    each posting stores its final BM25 weight (idf x saturated tf with length
+    normalization), so a query only sums the weights of its terms' postings.
+    Postings and document lengths are spilled as typed arrays while records
+    stream and laid out SPILL_EVERY postings at a time on close, so memory
+    grows with the vocabulary, not with the corpus.
+    """
+
+    def __init__(self, out_dir: Path, k1: float = K1, b: float = B):
+        self.dir = out_dir / BM25_DIR
+        self.k1 = k1
+        self.b = b
+        self.count = 0
+        self._terms: Dict[str, int] = {}
+
+    def __enter__(self) -> "BM25Writer":
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._term_rows = SpillBuffer(self.dir / "_term_rows.spill")
+        self._docs = SpillBuffer(self.dir / "_docs.spill")
+        self._tf = SpillBuffer(self.dir / "_tf.spill")
+        self._doc_len = SpillBuffer(self.dir / "_doc_len.spill")
+        return self
+
+    def write_records(self, records: Iterable[Dict]) -> None:
+        for r in records:
+            tokens = analyze(r.get("text") or r.get("text_preview") or "")
+            for term, tf in Counter(tokens).items():
+                self._term_rows.append(self._terms.setdefault(term, len(self._terms)))
+                self._docs.append(self.count)
+                self._tf.append(tf)
+            self._doc_len.append(len(tokens))
+            self.count += 1
+
+    def __exit__(self, *exc) -> None:
+        spills = (self._term_rows, self._docs, self._tf, self._doc_len)
+        try:
+            self._write(*(spill.close() for spill in spills))
+        finally:
+            for spill in spills:
+                spill.unlink()
+
+    def _write(self, term_rows: np.ndarray, doc_ids: np.ndarray, term_tf: np.ndarray, doc_len: np.ndarray) -> None:
+        terms = sorted(self._terms)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[[self._terms[t] for t in terms]] = np.arange(len(terms))
+        ptr = csr_ptr(term_rows, len(terms), rank)
+        df = np.diff(ptr)
+        n = max(self.count, 1)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+
+        total_len = float(np.sum(doc_len, dtype=np.float64))
+        avgdl = total_len / len(doc_len) if len(doc_len) and total_len else 1.0
+        docs = open_array(self.dir / "docs.npy", np.int32, len(term_rows))
+        weights = open_array(self.dir / "weights.npy", np.float32, len(term_rows))
+        for step, rows, positions in csr_layout(term_rows, ptr, rank):
+            d = np.asarray(doc_ids[step])
+            tf = np.asarray(term_tf[step], dtype=np.float64)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[d].astype(np.float64) / avgdl)
+            docs[positions] = d
+            weights[positions] = idf[rows] * tf * (self.k1 + 1.0) / (tf + norm)
+        del docs, weights
+
+        write_string_column(self.dir, "vocab", terms)
+        np.save(self.dir / "ptr.npy", ptr)
+        (self.dir / "bm25.json").write_text(
+            json.dumps(
+                {
+                    "docs": self.count,
+                    "terms": len(terms),
+                    "avgdl": avgdl,
+                    "k1": self.k1,
+                    "b": self.b,
+                    "analyzer": ANALYZER_VERSION,
+                }
+            ),
+            encoding="utf-8",
+        )
+
+
+class BM25Index:
+    """Read-only BM25 index over mapped arrays: postings of vocab[t] are docs/weights[ptr[t]:ptr[t + 1]]."""
+
+    def __init__(self, vocab: StringColumn, ptr: np.ndarray, docs: np.ndarray, weights: np.ndarray, info: Dict):
+        self.vocab = vocab
+        self.ptr = ptr
+        self.docs = docs
+        self.weights = weights
+        self.info = info
+
+    def _term_id(self, term: str) -> Optional[int]:
+        i = bisect.bisect_left(self.vocab, term)
+        return i if i < len(self.vocab) and self.vocab[i] == term else None
+
+    def search(self, terms: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (chunk positions, BM25 scores) of every chunk containing at least one
+        of `terms`; only those terms' postings are read.
+        """
+        ids = sorted({t for t in (self._term_id(term) for term in set(terms)) if t is not None})
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        ptr = self.ptr
+        docs = np.concatenate([self.docs[ptr[t] : ptr[t + 1]] for t in ids])
+        weights = np.concatenate([self.weights[ptr[t] : ptr[t + 1]] for t in ids])
+        uniq, inv = np.unique(docs, return_inverse=True)
+        return uniq.astype(np.int64), np.bincount(inv, weights=weights)
+
+    def search_text(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search(analyze(text))
+
+
+def load_bm25(index_dir: Path) -> Optional[BM25Index]:
+    """The version's BM25 index, or None for builds without one (or from another analyzer version)."""
+    bm25_dir = index_dir / BM25_DIR
+    info_path = bm25_dir / "bm25.json"
+    if not info_path.exists():
+        return None
+    info = json.loads(info_path.read_text(encoding="utf-8"))
+    if info.get("analyzer") != ANALYZER_VERSION:
+        log.warning(
+            "BM25 index in %s uses analyzer v%s, expected v%s; rebuild the index to use it",
+            index_dir, info.get("analyzer"), ANALYZER_VERSION,
+        )
+        return None
+    return BM25Index(
+        load_string_column(bm25_dir, "vocab"),
+        np.load(bm25_dir / "ptr.npy", mmap_mode="r"),
+        np.load(bm25_dir / "docs.npy", mmap_mode="r"),
+        np.load(bm25_dir / "weights.npy", mmap_mode="r"),
+        info,
+    )
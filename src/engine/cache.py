@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for symptom text: lowercased, whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a per-entry TTL and hit/miss counters.
+
+    Entries are keyed by the index version they were computed against as well
+    as by `key`, so a new index never serves results of the old one. Entries of
+    an old version are not dropped on a version change: requests still running
+    on the old snapshot during a hot-swap keep using them, and LRU / TTL evict
+    them once nothing asks for them.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.version: Optional[str] = None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Optional[str] = None, default: Any = None) -> Any:
+        key = (version, key)
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, version: Optional[str] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        key = (version, key)
+        with self._lock:
+            if version is not None:
+                # version of the last entry cached, for stats()
+                self.version = version
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "index_version": self.version,
+        }
+
+
+def cache_from_env(prefix: str, maxsize: int, ttl_s: float) -> TTLCache:
+    """TTLCache sized by <prefix>_SIZE / <prefix>_TTL_S env vars (size 0 disables it)."""
+    return TTLCache(
+        maxsize=int(os.getenv(f"{prefix}_SIZE", str(maxsize))),
+        ttl_s=float(os.getenv(f"{prefix}_TTL_S", str(ttl_s))),
+    )
@@ -0,0 +1,140 @@
+import bisect
+import math
+import re
+from itertools import accumulate
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+_SPLIT_RE = re.compile(r"(\s+)")
+KEYWORD_RE = re.compile(r"[а-яa-z]{4,}")
+
+# window budget in encoder tokens (special tokens excluded) when no encoder is given;
+# paraphrase-multilingual-MiniLM-L12-v2 reads 128 tokens, including [CLS] and [SEP]
+DEFAULT_MAX_TOKENS = 126
+# share of each window repeated at the start of the next one
+DEFAULT_OVERLAP = 0.25
+
+
+def extract_keywords(text: str) -> set:
+    tokens = KEYWORD_RE.findall(text.lower())
+    return set(tokens)
+
+
+def estimate_tokens(word: str) -> int:
+    """Subword count of a word without a tokenizer: about 4 characters per token."""
+    return max(1, math.ceil(len(word) / 4))
+
+
+@dataclass
+class Window:
+    start: int  # character offsets of the window in the text
+    end: int
+    n_tokens: int
+    keywords: frozenset
+
+
+class TokenCounter:
+    """Encoder tokens per word, memoized: a corpus repeats the same words over and over."""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+        self._cache: Dict[str, int] = {}
+
+    def __call__(self, words: Sequence[str]) -> List[int]:
+        cache = self._cache
+        new = list(dict.fromkeys(w for w in words if w not in cache))
+        if new:
+            if self.tokenizer is None:
+                cache.update((w, estimate_tokens(w)) for w in new)
+            else:
+                ids = self.tokenizer(new, add_special_tokens=False)["input_ids"]
+                cache.update((w, max(1, len(t))) for w, t in zip(new, ids))
+        return [cache[w] for w in words]
+
+
+class Chunker:
+    """
+    Overlapping sliding windows over a text under a token budget.
+
+    The text is split once into words with their offsets and token counts;
+    windows are cut from those offsets (the window text is a slice of the
+    original, never re-joined). Keywords are extracted once per stretch of
+    text between two window boundaries and each window's set is the union of
+    its stretches, so every word is lowercased and matched exactly once
+    however much the windows overlap.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        overlap_tokens: Optional[int] = None,
+        count_tokens: Optional[Callable[[Sequence[str]], List[int]]] = None,
+    ):
+        if overlap_tokens is None:
+            overlap_tokens = int(max_tokens * DEFAULT_OVERLAP)
+        if max_tokens < 1 or not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"Invalid window: {max_tokens} tokens with {overlap_tokens} overlap")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens or TokenCounter()
+
+    @classmethod
+    def for_encoder(
+        cls, model, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None
+    ) -> "Chunker":
+        """Windows sized to what `model` actually reads, counted with its own tokenizer when it has one."""
+        if max_tokens is None:
+            seq = getattr(model, "max_seq_length", None)
+            max_tokens = seq - 2 if seq else DEFAULT_MAX_TOKENS
+        return cls(max_tokens, overlap_tokens, TokenCounter(getattr(model, "tokenizer", None)))
+
+    def config(self) -> Dict:
+        return {"max_tokens": self.max_tokens, "overlap_tokens": self.overlap_tokens}
+
+    def windows(self, text: str) -> List[Window]:
+        """
+        Windows of `text`, in order. A text that fits one window (an empty one
+        included) is a single window over all of it, as before chunking.
+        """
+        # words and whitespace alternate: word k is parts[2k] at offs[2k]:offs[2k + 1]
+        parts = _SPLIT_RE.split(text)
+        offs = list(accumulate(map(len, parts), initial=0))
+        words, starts, ends = parts[0::2], offs[0::2], offs[1::2]
+        lo, hi = int(not words[0]), len(words) - int(not words[-1])
+        words, starts, ends = words[lo:hi], starts[lo:hi], ends[lo:hi]
+        n = len(words)
+        if not n:
+            return [Window(0, len(text), 0, frozenset())]
+
+        costs = self.count_tokens(words)
+        cum = list(accumulate(costs, initial=0))
+        if cum[n] <= self.max_tokens:
+            return [Window(0, len(text), cum[n], frozenset(extract_keywords(text)))]
+        bounds = []  # (first word, end word) per window
+        i = 0
+        while True:
+            # up to the budget; a single word over it still makes its own window
+            j = max(i + 1, bisect.bisect_right(cum, cum[i] + self.max_tokens) - 1)
+            bounds.append((i, j))
+            if j == n:
+                break
+            # the next window starts with the last <= overlap_tokens of this one,
+            # as long as the next new word still fits after them
+            limit = min(self.overlap_tokens, self.max_tokens - costs[j])
+            i = min(j, max(i + 1, bisect.bisect_left(cum, cum[j] - limit)))
+
+        cuts = sorted({b for bound in bounds for b in bound})
+        at = {c: k for k, c in enumerate(cuts)}
+        stretches = [
+            frozenset(KEYWORD_RE.findall(text[starts[a] : ends[b - 1]].lower()))
+            for a, b in zip(cuts, cuts[1:])
+        ]
+        return [
+            Window(
+                starts[i],
+                ends[j - 1],
+                cum[j] - cum[i],
+                frozenset().union(*stretches[at[i] : at[j]]),
+            )
+            for i, j in bounds
+        ]
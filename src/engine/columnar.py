@@ -0,0 +1,288 @@
+import json
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.engine.icd import IcdHierarchy
+
+# <version dir>/columns/: metadata one file per column, memory-mapped read-only at serving
+COLUMNS_DIR = "columns"
+EMBEDDINGS_NAME = "embeddings.npy"
+
+STRING_COLUMNS = ("protocol_id", "diagnosis", "source_file", "text_preview")
+# full chunk text: read by the reranker only, so not part of the row view
+TEXT_COLUMN = "text"
+# values a build buffer holds in memory before spilling them to disk; also the
+# number of postings laid out per step when CSR arrays are written
+SPILL_EVERY = 1 << 20
+
+
+class StringColumn:
+    """
+    Read-only string column over a mapped UTF-8 blob: value i is
+    data[offsets[i]:offsets[i + 1]]. Values are decoded on access only, so a
+    worker holds no per-row Python objects. Sorted columns work with bisect.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.data[self.offsets[i] : self.offsets[i + 1]]).decode("utf-8")
+
+
+class ColumnTable:
+    """Row view over the string columns; rows are plain dicts like the JSON metadata records."""
+
+    def __init__(self, columns: Dict[str, StringColumn]):
+        self.columns = columns
+        self._n = len(next(iter(columns.values())))
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i: int) -> Dict:
+        return {name: col[i] for name, col in self.columns.items()}
+
+
+def load_string_column(col_dir: Path, name: str) -> StringColumn:
+    offsets = np.load(col_dir / f"{name}.offsets.npy", mmap_mode="r")
+    path = col_dir / f"{name}.bin"
+    # np.memmap refuses empty files
+    data = np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else np.zeros(0, np.uint8)
+    return StringColumn(offsets, data)
+
+
+def load_array(col_dir: Path, name: str) -> np.ndarray:
+    return np.load(col_dir / f"{name}.npy", mmap_mode="r")
+
+
+def write_string_column(col_dir: Path, name: str, values: Iterable[str]) -> None:
+    offsets = [0]
+    with (col_dir / f"{name}.bin").open("wb") as f:
+        for v in values:
+            offsets.append(offsets[-1] + f.write(v.encode("utf-8")))
+    np.save(col_dir / f"{name}.offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+
+def write_icd_hierarchy(col_dir: Path, icd: IcdHierarchy) -> None:
+    write_string_column(col_dir, "icd_nodes", icd.labels)
+    np.save(col_dir / "icd_node_level.npy", np.asarray(icd.level, dtype=np.int8))
+    np.save(col_dir / "icd_node_parent.npy", np.asarray(icd.parent, dtype=np.int32))
+    np.save(col_dir / "icd_code_node.npy", icd.code_node)
+    np.save(col_dir / "icd_code_category.npy", icd.code_category)
+
+
+def load_icd_hierarchy(col_dir: Path, icd_codes) -> IcdHierarchy:
+    """The ICD hierarchy stored with the columns; built from icd_codes for builds without one."""
+    if not (col_dir / "icd_code_node.npy").exists():
+        return IcdHierarchy.build(icd_codes)
+    return IcdHierarchy(
+        load_string_column(col_dir, "icd_nodes"),
+        load_array(col_dir, "icd_node_level"),
+        load_array(col_dir, "icd_node_parent"),
+        load_array(col_dir, "icd_code_node"),
+        load_array(col_dir, "icd_code_category"),
+    )
+
+
+class SpillBuffer:
+    """
+    Append-only integer column of a build. Values collect in a typed array
+    and are appended to a raw file every SPILL_EVERY values, so a build holds
+    one bounded buffer per column whatever the corpus size. close() maps the
+    whole column back read-only.
+    """
+
+    def __init__(self, path: Path, typecode: str = "i"):
+        self.path = path
+        self.typecode = typecode
+        self.count = 0
+        self._buf = array(typecode)
+        self._file = path.open("wb")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, value: int) -> None:
+        self._buf.append(value)
+        self.count += 1
+        if len(self._buf) >= SPILL_EVERY:
+            self._spill()
+
+    def extend(self, values: Iterable[int]) -> None:
+        n = len(self._buf)
+        self._buf.extend(values)
+        self.count += len(self._buf) - n
+        if len(self._buf) >= SPILL_EVERY:
+            self._spill()
+
+    def _spill(self) -> None:
+        self._buf.tofile(self._file)
+        self._buf = array(self.typecode)
+
+    def close(self) -> np.ndarray:
+        self._spill()
+        self._file.close()
+        dtype = np.dtype(self.typecode)
+        # np.memmap refuses empty files
+        return np.memmap(self.path, dtype=dtype, mode="r") if self.count else np.zeros(0, dtype)
+
+    def unlink(self) -> None:
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+def _rows(rows: np.ndarray, step: slice, rank: Optional[np.ndarray]) -> np.ndarray:
+    r = np.asarray(rows[step], dtype=np.int64)
+    return r if rank is None else rank[r]
+
+
+def csr_ptr(rows: np.ndarray, n_rows: int, rank: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Row pointers of the CSR over the row id of each entry (rank[id] when
+    given), counted SPILL_EVERY entries at a time.
+    """
+    counts = np.zeros(n_rows, dtype=np.int64)
+    for start in range(0, len(rows), SPILL_EVERY):
+        counts += np.bincount(_rows(rows, slice(start, start + SPILL_EVERY), rank), minlength=n_rows)
+    ptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=ptr[1:])
+    return ptr
+
+
+def csr_layout(
+    rows: np.ndarray, ptr: np.ndarray, rank: Optional[np.ndarray] = None
+) -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+    """
+    (entries, their rows, positions) per step of SPILL_EVERY entries: entry
+    start + i goes to out[positions[i]] of the CSR arrays, so entries of a row
+    keep their insertion order and the arrays can be filled step by step.
+    """
+    cursor = ptr[:-1].copy()
+    for start in range(0, len(rows), SPILL_EVERY):
+        step = slice(start, start + SPILL_EVERY)
+        r = _rows(rows, step, rank)
+        order = np.argsort(r, kind="stable")
+        sorted_rows = r[order]
+        positions = np.empty(len(r), dtype=np.int64)
+        positions[order] = cursor[sorted_rows] + (
+            np.arange(len(r)) - np.searchsorted(sorted_rows, sorted_rows)
+        )
+        cursor += np.bincount(r, minlength=len(cursor))
+        yield step, r, positions
+
+
+def open_array(path: Path, dtype, n: int) -> np.ndarray:
+    """Writable .npy of n values, filled in place; np.save for empty arrays, which cannot be mapped."""
+    if not n:
+        np.save(path, np.zeros(0, dtype=dtype))
+        return np.zeros(0, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n,))
+
+
+class ColumnWriter:
+    """
+    Writes the columnar metadata of a version while the build streams records
+    (the same dicts as metadata.json). String columns go straight to disk;
+    offsets, keyword postings and the vector -> ICD table are spilled as
+    typed arrays and laid out as CSR arrays on close, with the terms sorted
+    so lookups can bisect the mapped column, along with the ICD hierarchy of
+    the version's codes. Memory grows with the vocabulary and the distinct
+    codes, not with the corpus.
+    """
+
+    def __init__(self, out_dir: Path):
+        self.col_dir = out_dir / COLUMNS_DIR
+        self.count = 0
+        self._files = {}
+        self._ends = {name: 0 for name in STRING_COLUMNS + (TEXT_COLUMN,)}
+        self._offsets: Dict[str, SpillBuffer] = {}
+        self._terms: Dict[str, int] = {}
+        self._icd: Dict[str, int] = {}
+
+    def _spill(self, name: str, typecode: str = "i") -> SpillBuffer:
+        return SpillBuffer(self.col_dir / f"_{name}.spill", typecode)
+
+    def __enter__(self) -> "ColumnWriter":
+        self.col_dir.mkdir(parents=True, exist_ok=True)
+        self._files = {name: (self.col_dir / f"{name}.bin").open("wb") for name in self._ends}
+        self._offsets = {name: self._spill(f"{name}.offsets", "q") for name in self._ends}
+        for offsets in self._offsets.values():
+            offsets.append(0)
+        self._term_rows = self._spill("term_rows")
+        self._term_chunks = self._spill("term_chunks")
+        self._icd_ptr = self._spill("icd_ptr", "q")
+        self._icd_ptr.append(0)
+        self._icd_ids = self._spill("icd_ids")
+        return self
+
+    def write_records(self, records: Iterable[Dict]) -> None:
+        for r in records:
+            for name, f in self._files.items():
+                self._ends[name] += f.write((r.get(name) or "").encode("utf-8"))
+                self._offsets[name].append(self._ends[name])
+            for kw in r.get("keywords") or ():
+                self._term_rows.append(self._terms.setdefault(kw, len(self._terms)))
+                self._term_chunks.append(self.count)
+            codes = r.get("icd10_codes") or [""]
+            self._icd_ids.extend(self._icd.setdefault(c, len(self._icd)) for c in codes)
+            self._icd_ptr.append(len(self._icd_ids))
+            self.count += 1
+
+    def __exit__(self, *exc) -> None:
+        spills = [*self._offsets.values(), self._term_rows, self._term_chunks, self._icd_ptr, self._icd_ids]
+        try:
+            for name, f in self._files.items():
+                f.close()
+                _save_spilled(self.col_dir / f"{name}.offsets.npy", self._offsets[name].close(), np.int64)
+
+            # terms sorted so the served vocab column can be searched with bisect
+            terms = sorted(self._terms)
+            rank = np.empty(len(terms), dtype=np.int64)
+            rank[[self._terms[t] for t in terms]] = np.arange(len(terms))
+            rows, chunks = self._term_rows.close(), self._term_chunks.close()
+            ptr = csr_ptr(rows, len(terms), rank)
+            postings = open_array(self.col_dir / "postings.npy", np.int32, len(rows))
+            for step, _, positions in csr_layout(rows, ptr, rank):
+                postings[positions] = chunks[step]
+            del postings
+            write_string_column(self.col_dir, "vocab", terms)
+            np.save(self.col_dir / "postings_ptr.npy", ptr)
+
+            write_string_column(self.col_dir, "icd_codes", list(self._icd))
+            _save_spilled(self.col_dir / "vec_icd_ptr.npy", self._icd_ptr.close(), np.int64)
+            _save_spilled(self.col_dir / "vec_icd.npy", self._icd_ids.close(), np.int32)
+            write_icd_hierarchy(self.col_dir, IcdHierarchy.build(list(self._icd)))
+
+            (self.col_dir / "columns.json").write_text(
+                json.dumps({"rows": self.count, "strings": list(STRING_COLUMNS)}), encoding="utf-8"
+            )
+        finally:
+            for spill in spills:
+                spill.unlink()
+
+
+def _save_spilled(path: Path, values: np.ndarray, dtype) -> None:
+    """.npy copy of a spilled column, SPILL_EVERY values at a time."""
+    out = open_array(path, dtype, len(values))
+    for start in range(0, len(values), SPILL_EVERY):
+        out[start : start + SPILL_EVERY] = values[start : start + SPILL_EVERY]
+    del out
+
+
+def save_embeddings(xb: np.ndarray, out_dir: Path, shard_size: int = 65536) -> None:
+    """Raw float32 .npy copy of the flat vectors, written shard by shard."""
+    out = np.lib.format.open_memmap(
+        out_dir / EMBEDDINGS_NAME, mode="w+", dtype=np.float32, shape=xb.shape
+    )
+    for start in range(0, len(xb), shard_size):
+        out[start : start + shard_size] = xb[start : start + shard_size]
+    out.flush()
+    del out
@@ -0,0 +1,157 @@
+import json
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+# torch: sentence-transformers on PyTorch; onnx: ONNX Runtime over an exported model
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_DIR = Path(os.getenv("ONNX_DIR", "data/models/onnx"))
+# model.onnx, or model_int8.onnx for the dynamically quantized export
+ONNX_FILE = os.getenv("ONNX_FILE", "model.onnx")
+# intra-op threads of the encoder; 0 keeps the runtime's default (all cores)
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+
+CONFIG_NAME = "encoder.json"
+ONNX_NAME = "model.onnx"
+ONNX_INT8_NAME = "model_int8.onnx"
+BACKENDS = ("torch", "onnx")
+
+
+class OnnxEncoder:
+    """
+    SentenceTransformer work-alike on ONNX Runtime for models with mean
+    pooling: tokenizer -> exported transformer -> masked mean -> optional L2 norm.
+    """
+
+    def __init__(self, model_dir: Path, file_name: str = ONNX_NAME, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        config = json.loads((model_dir / CONFIG_NAME).read_text(encoding="utf-8"))
+        self.model_name = config["model"]
+        self.max_seq_length = config["max_seq_length"]
+        self.dim = config["dim"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            str(model_dir / file_name), opts, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # longest first, as sentence-transformers does, so batches need little padding
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        out = np.empty((len(sentences), self.dim), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            idx = order[start : start + batch_size]
+            enc = self.tokenizer(
+                [sentences[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._inputs}
+            tokens = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            out[idx] = (tokens * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+def load_encoder(model_name: str, backend: str = ENCODER_BACKEND, threads: int = ENCODER_THREADS):
+    """Query encoder for `model_name` on the configured backend."""
+    if backend == "onnx":
+        model = OnnxEncoder(ONNX_DIR, ONNX_FILE, threads)
+        if model.model_name != model_name:
+            raise RuntimeError(
+                f"ONNX export in {ONNX_DIR} is of {model.model_name}, expected {model_name}"
+            )
+        return model
+    if backend != "torch":
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {BACKENDS})")
+
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
+
+
+def export_onnx(model_name: str, out_dir: Path, quantize: bool = False, opset: int = 17) -> Path:
+    """
+    Exports the transformer of a sentence-transformers model to ONNX (dynamic
+    batch and sequence axes) next to its tokenizer; pooling runs in OnnxEncoder.
+    With `quantize`, also writes a dynamically int8-quantized copy.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name}: only mean-pooling models can be exported")
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    sample = tokenizer(["пример запроса", "example"], padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def forward(self, *inputs):
+            return hf_model(**dict(zip(names, inputs))).last_hidden_state
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(),
+            tuple(sample[n] for n in names),
+            str(out_dir / ONNX_NAME),
+            input_names=names,
+            output_names=["token_embeddings"],
+            dynamic_axes={**{n: axes for n in names}, "token_embeddings": axes},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(str(out_dir))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            str(out_dir / ONNX_NAME), str(out_dir / ONNX_INT8_NAME), weight_type=QuantType.QInt8
+        )
+
+    config = {
+        "model": model_name,
+        "max_seq_length": st.max_seq_length,
+        "dim": st.get_sentence_embedding_dimension(),
+        "pooling": "mean",
+    }
+    (out_dir / CONFIG_NAME).write_text(json.dumps(config, indent=2), encoding="utf-8")
+    return out_dir
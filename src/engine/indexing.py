@@ -1,73 +1,198 @@
+import hashlib
 import json
-from dataclasses import dataclass
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+from src.engine.chunking import Chunker, extract_keywords
+
+FAISS_NAME = "embeddings.faiss"
+META_NAME = "metadata.json"
+MANIFEST_NAME = "manifest.json"
+# <index root>/CURRENT names the served version in <index root>/versions/
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
 
 
 @dataclass
 class Chunk:
     protocol_id: str
-    icd10_code: str
     diagnosis: str
     text: str
     source_file: str
+    # every ICD code the text is evidence for; expanded at retrieval time
+    icd10_codes: List[str] = field(default_factory=list)
+    # computed by the chunker along with the window; None: extract from text
+    keywords: Optional[frozenset] = field(default=None, compare=False, repr=False)
 
 
-def load_chunks(protocols_path: Path) -> List[Chunk]:
+def iter_chunks(protocols_path: Path, chunker: Optional[Chunker] = None) -> Iterator[Chunk]:
     """
+    Each protocol is split into overlapping windows that fit the encoder
+    (see Chunker), so long protocols are embedded whole instead of truncated.
     1 protocol line may contain multiple icd_codes.
-    We create 1 chunk per icd10_code (IMPORTANT for eval alignment).
+    Every window is embedded once and carries all of them; retrieval expands the
+    codes after search (1 result slot per icd10_code, IMPORTANT for eval alignment).
+    Streams the corpus: only the current protocol line is held in memory.
     """
-    chunks: List[Chunk] = []
+    chunker = chunker or Chunker()
     with protocols_path.open("r", encoding="utf-8") as f:
         for line in f:
             if not line.strip():
                 continue
             p = json.loads(line)
 
-            protocol_id = p.get("protocol_id", "")
             source_file = p.get("source_file", "")
-            title = p.get("title", "") or source_file
+            diagnosis = p.get("title", "") or source_file
+            codes = list(dict.fromkeys(str(c) for c in p.get("icd_codes") or []))
             text = p.get("text", "") or ""
-            icd_codes = p.get("icd_codes") or []
-
-            # fallback: if empty, still keep one chunk
-            if not icd_codes:
-                chunks.append(
-                    Chunk(
-                        protocol_id=protocol_id,
-                        icd10_code="",
-                        diagnosis=title,
-                        text=text,
-                        source_file=source_file,
-                    )
+            for w in chunker.windows(text):
+                yield Chunk(
+                    protocol_id=p.get("protocol_id", ""),
+                    diagnosis=diagnosis,
+                    text=text[w.start : w.end],
+                    source_file=source_file,
+                    icd10_codes=list(codes),
+                    keywords=w.keywords,
                 )
-                continue
 
-            for code in icd_codes:
-                chunks.append(
-                    Chunk(
-                        protocol_id=protocol_id,
-                        icd10_code=str(code),
-                        diagnosis=title,
-                        text=text,
-                        source_file=source_file,
-                    )
-                )
 
-    return chunks
+def load_chunks(protocols_path: Path, chunker: Optional[Chunker] = None) -> List[Chunk]:
+    return list(iter_chunks(protocols_path, chunker))
+
+
+def iter_shards(chunks: Iterable[Chunk], shard_size: int) -> Iterator[List[Chunk]]:
+    it = iter(chunks)
+    while shard := list(islice(it, shard_size)):
+        yield shard
+
+
+def protocol_key(c: Chunk) -> str:
+    """Incremental-update key: protocol_id, or the content hash when a protocol has none."""
+    return c.protocol_id or f"sha1:{content_hash(c)}"
+
+
+def content_hash(c: Chunk) -> str:
+    payload = json.dumps(
+        [c.protocol_id, c.diagnosis, c.source_file, c.icd10_codes, c.text],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_metadata(c: Chunk, vector_id: Optional[int] = None) -> Dict:
+    meta = {} if vector_id is None else {"id": int(vector_id)}
+    return {
+        **meta,
+        "protocol_id": c.protocol_id,
+        "icd10_codes": c.icd10_codes,
+        "diagnosis": c.diagnosis,
+        "source_file": c.source_file,
+        "text_preview": c.text[:300],
+        # full chunk text for the column and BM25 writers; not kept in metadata.json
+        "text": c.text,
+        "keywords": sorted(c.keywords if c.keywords is not None else extract_keywords(c.text)),
+    }
+
+
+class MetadataWriter:
+    """
+    Writes metadata.json (a JSON array, one record per vector) incrementally,
+    so the build never holds the metadata of the whole corpus. Full chunk
+    texts are left out: they are stored once, in columns/text.bin.
+    """
+
+    def __init__(self, out_path: Path):
+        self.out_path = out_path
+        self.count = 0
+        self._f = None
+
+    def __enter__(self) -> "MetadataWriter":
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.out_path.open("w", encoding="utf-8")
+        self._f.write("[")
+        return self
+
+    def write(self, chunks: List[Chunk], ids: Optional[Iterable[int]] = None) -> None:
+        ids = ids if ids is not None else [None] * len(chunks)
+        self.write_records(chunk_metadata(c, i) for c, i in zip(chunks, ids))
+
+    def write_records(self, records: Iterable[Dict]) -> None:
+        for r in records:
+            self._f.write(",\n" if self.count else "\n")
+            self._f.write(json.dumps({k: v for k, v in r.items() if k != "text"}, ensure_ascii=False))
+            self.count += 1
+
+    def __exit__(self, *exc) -> None:
+        self._f.write("\n]\n")
+        self._f.close()
 
 
 def save_metadata(chunks: List[Chunk], out_path: Path) -> None:
-    meta = [
-        {
-            "protocol_id": c.protocol_id,
-            "icd10_code": c.icd10_code,
-            "diagnosis": c.diagnosis,
-            "source_file": c.source_file,
-            "text_preview": c.text[:300],
-        }
-        for c in chunks
-    ]
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
\ No newline at end of file
+    with MetadataWriter(out_path) as w:
+        w.write(chunks)
+
+
+def resolve_index_dir(root: Path) -> Path:
+    """Directory of the served index: the CURRENT version, or `root` itself for a flat layout."""
+    pointer = root / CURRENT_FILE
+    if pointer.exists():
+        return root / VERSIONS_DIR / pointer.read_text(encoding="utf-8").strip()
+    return root
+
+
+def stage_version(root: Path) -> Tuple[str, Path]:
+    """Fresh (version name, staging dir) for a new index version."""
+    name = time.strftime("%Y%m%dT%H%M%S")
+    versions = root / VERSIONS_DIR
+    n = 1
+    while (versions / name).exists():
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{n}"
+        n += 1
+    staging = versions / f".staging-{name}"
+    staging.mkdir(parents=True)
+    return name, staging
+
+
+def publish_version(root: Path, name: str, staging: Path, keep: int = 3) -> Path:
+    """
+    Atomically make a staged version the served one: the staging dir is renamed
+    into place, then CURRENT is replaced in one os.replace. Readers see either
+    the old or the new version, never a half-written one.
+    Of the versions older than the previous CURRENT, only enough to keep the
+    newest `keep` versions in total are retained. The previous CURRENT and
+    anything newer are never deleted here: API processes that have not
+    reloaded yet may still have them mapped.
+    """
+    versions = root / VERSIONS_DIR
+    final = versions / name
+    os.replace(staging, final)
+
+    pointer = root / CURRENT_FILE
+    previous = pointer.read_text(encoding="utf-8").strip() if pointer.exists() else None
+    tmp_pointer = root / f".{CURRENT_FILE}.tmp"
+    tmp_pointer.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp_pointer, pointer)
+
+    old = sorted(p for p in versions.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for p in old[:-keep] if keep > 0 else []:
+        if p != final and previous is not None and p.name < previous:
+            shutil.rmtree(p, ignore_errors=True)
+    return final
+
+
+def load_manifest(index_dir: Path) -> Optional[Dict]:
+    path = index_dir / MANIFEST_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest: Dict, index_dir: Path) -> None:
+    (index_dir / MANIFEST_NAME).write_text(
+        json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+# seconds, 100 us .. 10 s
+LATENCY_BUCKETS_S = [
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus style: bucket `le` counts
+    every observation <= le). Thread-safe, cheap enough for the hot path.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = {}
+        running = 0
+        for le, c in zip(self.buckets + [float("inf")], counts):
+            running += c
+            cumulative["+Inf" if le == float("inf") else f"{le:g}"] = running
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+def pow2_buckets(upper: int) -> list:
+    """1, 2, 4, ... up to and including `upper`."""
+    out = []
+    b = 1
+    while b < upper:
+        out.append(b)
+        b *= 2
+    out.append(upper)
+    return out
+
+
+class Timings:
+    """
+    Per-stage durations of one call, in seconds on the monotonic clock.
+    A stage entered several times (e.g. once per query of a batch) adds up.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def ms(self) -> Dict[str, float]:
+        return {k: round(v * 1000.0, 3) for k, v in self.seconds.items()}
+
+
+class HistogramVec:
+    """One Histogram per label value (e.g. per stage), created on first use."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_S):
+        self.buckets = list(buckets)
+        self._hists: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def get(self, label: str) -> Histogram:
+        h = self._hists.get(label)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(label, Histogram(self.buckets))
+        return h
+
+    def observe(self, label: str, value: float) -> None:
+        self.get(label).observe(value)
+
+    def observe_timings(self, timings: Timings) -> None:
+        for stage, seconds in timings.seconds.items():
+            self.get(stage).observe(seconds)
+
+    def items(self) -> List[Tuple[str, Histogram]]:
+        with self._lock:
+            return sorted(self._hists.items())
+
+
+Sample = Tuple[Dict[str, str], Union[float, Histogram]]
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def prometheus_family(name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> List[str]:
+    """
+    Prometheus text exposition of one metric family. `samples` are
+    (labels, value) pairs; for kind "histogram" the values are Histograms.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if kind != "histogram":
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+            continue
+        snap = value.snapshot()
+        for le, count in snap["buckets"].items():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {snap['sum']:g}")
+        lines.append(f"{name}_count{_labels(labels)} {snap['count']}")
+    return lines
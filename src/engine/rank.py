@@ -1,25 +1,13 @@
-from typing import List, Dict
-import re
+from typing import List, Dict, Tuple
 
-def normalize_icd(code: str) -> str:
-    """
-    Normalize ICD-10 code for evaluation.
-    Examples:
-      "S22.0 " -> "S22.0"
-      "S22.0," -> "S22.0"
-      "S22"    -> "S22"
-    """
-    if not code:
-        return ""
-    code = code.strip().upper()
-    match = re.match(r"^[A-Z]\d{2}(\.\d+)?", code)
-    return match.group(0) if match else code
+import numpy as np
+
+from src.engine.icd import normalize_icd
 
 def rank_candidates(items: List[Dict], top_n: int = 3) -> List[Dict]:
     best = {}
     for it in items:
-        raw_code = it.get("icd10_code") or ""
-        code = normalize_icd(raw_code)
+        code = normalize_icd(it.get("icd10_code") or "")
         if not code:
             continue
 
@@ -28,4 +16,48 @@ def rank_candidates(items: List[Dict], top_n: int = 3) -> List[Dict]:
             best[code] = it
 
     ranked = sorted(best.values(), key=lambda x: x.get("score", 0), reverse=True)
-    return ranked[:top_n]
\ No newline at end of file
+    return ranked[:top_n]
+
+
+def top_chunks(scores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Indices of the n highest scores, best first.
+    Same order as np.argsort(scores)[::-1][:n], but argpartition keeps it O(N).
+    """
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if n < len(scores):
+        idx = np.argpartition(scores, len(scores) - n)[len(scores) - n :]
+        # argpartition keeps an arbitrary subset of the scores tied at the cut;
+        # argsort()[::-1] keeps the last ones
+        cut = scores[idx].min()
+        tied = np.flatnonzero(scores == cut)
+        if len(tied) > 1:
+            above = idx[scores[idx] > cut]
+            idx = np.concatenate([above, tied[len(tied) - (n - len(above)) :]])
+        # ties then come out last first, as from argsort()[::-1]
+        idx.sort()
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(scores[idx], kind="stable")[::-1]]
+
+
+def aggregate_by_group(
+    top: np.ndarray,
+    scores: np.ndarray,
+    groups: np.ndarray,
+    top_k: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean score per group (e.g. ICD id) over the selected chunks, best group first.
+    Groups with equal means keep the order of their first appearance in `top`.
+    Returns (group ids, means, counts, first position in `top`).
+    """
+    uniq, first, inv = np.unique(groups[top], return_index=True, return_inverse=True)
+    counts = np.bincount(inv)
+    means = np.bincount(inv, weights=scores[top]) / counts
+
+    order = np.argsort(first, kind="stable")
+    order = order[np.argsort(-means[order], kind="stable")][:top_k]
+    return uniq[order], means[order], counts[order], first[order]
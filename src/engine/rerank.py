@@ -0,0 +1,165 @@
+"""
+Optional cross-encoder reranking of the top retrieval chunks (RERANK=1).
+
+A small multilingual cross-encoder re-scores the top RERANK_TOP_N chunks of
+each query on CPU; all pairs of a search block go through the model in one
+batched pass. Every request of the block waits for that pass, so the whole
+pass is held to RERANK_BUDGET_MS: queries are admitted in order while the
+block's uncached pairs fit the budget at the measured cost per pair, and a
+pass that runs over stops between model batches. Queries left out keep the
+bi-encoder order, as do all queries until the cost per pair is known.
+Scores are cached per (query, chunk) and index version.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from src.engine.cache import cache_from_env, normalize_query
+
+log = logging.getLogger(__name__)
+
+RERANK = os.getenv("RERANK", "0") != "0"
+# ~118M parameters, trained on mMARCO (Russian included); sigmoid scores in [0, 1]
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# weight of the newest measurement in the seconds-per-pair estimate
+_COST_ALPHA = 0.2
+
+# (normalized query, chunk position) -> cross-encoder score
+score_cache = cache_from_env("RERANK_CACHE", maxsize=100_000, ttl_s=3600)
+
+
+class Reranker:
+    """
+    Cross-encoder scores for (query, chunk) pairs under a time budget. The
+    model is loaded on first use; every pass updates the seconds-per-pair
+    estimate the next pass is planned with. Without an estimate (no warmup
+    yet) queries are not reranked and warmup() runs in the background.
+    """
+
+    def __init__(self, model_name: str, budget_ms: float, batch_size: int, max_length: int):
+        self.model_name = model_name
+        self.budget_s = budget_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.pair_s: Optional[float] = None
+        self.reranked = 0
+        self.fallbacks = 0
+        self.pairs = 0
+        self._model = None
+        self._lock = threading.Lock()
+        self._measuring = False
+
+    def model(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    log.info("Loading cross-encoder %s", self.model_name)
+                    self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+                model = self._model
+        return model
+
+    def warmup(self) -> None:
+        """Load the model and measure a first pass, so the budget holds from the first request."""
+        self._predict([("warmup", "warmup")] * min(self.batch_size, 8))
+
+    def _warmup_in_background(self) -> None:
+        with self._lock:
+            if self._measuring:
+                return
+            self._measuring = True
+
+        def run():
+            try:
+                self.warmup()
+            except Exception:
+                log.exception("Cross-encoder warmup failed; queries keep the bi-encoder order")
+
+        threading.Thread(target=run, name="rerank-warmup", daemon=True).start()
+
+    def _predict(self, pairs: List[tuple]) -> np.ndarray:
+        t0 = time.perf_counter()
+        scores = self.model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        per_pair = (time.perf_counter() - t0) / len(pairs)
+        with self._lock:
+            self.pair_s = per_pair if self.pair_s is None else (
+                (1.0 - _COST_ALPHA) * self.pair_s + _COST_ALPHA * per_pair
+            )
+        return np.asarray(scores, dtype=np.float64)
+
+    def score(
+        self,
+        queries: Sequence[str],
+        candidates: Sequence[np.ndarray],
+        text: Callable[[int], str],
+        version: Optional[str] = None,
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Cross-encoder score per candidate chunk of each query (chunk positions,
+        `text` gives a chunk's text), or None for queries left in bi-encoder
+        order. Queries are admitted in order while the uncached pairs of all
+        admitted queries fit the budget; admitted misses are scored in one
+        pass of model batches, which stops once the budget is spent.
+        """
+        pair_s = self.pair_s
+        if pair_s is None:
+            self._warmup_in_background()
+        # uncached pairs the whole block can afford
+        fit = 0.0 if pair_s is None else self.budget_s / pair_s
+        results: List[Optional[np.ndarray]] = []
+        pairs, slots = [], []
+        for i, (query, cand) in enumerate(zip(queries, candidates)):
+            key = normalize_query(query)
+            keys = [(key, int(c)) for c in cand]
+            scores = np.array([score_cache.get(k, version=version, default=np.nan) for k in keys])
+            miss = np.flatnonzero(np.isnan(scores))
+            if len(miss) and len(pairs) + len(miss) > fit:
+                results.append(None)
+                continue
+            for j in miss:
+                pairs.append((query, text(int(cand[j]))))
+                slots.append((i, j, keys[j]))
+            results.append(scores)
+
+        deadline = time.perf_counter() + self.budget_s
+        done = 0
+        while done < len(pairs) and time.perf_counter() < deadline:
+            fresh = self._predict(pairs[done : done + self.batch_size])
+            for (i, j, key), s in zip(slots[done:], fresh):
+                results[i][j] = s
+                score_cache.put(key, float(s), version=version)
+            done += len(fresh)
+        # the pass ran over: queries not fully scored keep the bi-encoder order
+        for i, _, _ in slots[done:]:
+            results[i] = None
+        with self._lock:
+            self.pairs += done
+            self.fallbacks += sum(r is None for r in results)
+            self.reranked += sum(r is not None for r in results)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "enabled": RERANK,
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "budget_ms": self.budget_s * 1000.0,
+            "ms_per_pair": round(self.pair_s * 1000.0, 4) if self.pair_s is not None else None,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "pairs_scored": self.pairs,
+            "cache": score_cache.stats(),
+        }
+
+
+reranker = Reranker(RERANK_MODEL, RERANK_BUDGET_MS, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH)
@@ -1,109 +1,659 @@
+import bisect
+import hashlib
 import json
-import re
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict
-from collections import defaultdict
+from typing import Any, List, Dict, Optional, Sequence
 
+import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from src.engine.ann import ANN_NAME, flat_vectors, set_search_params
+from src.engine.bm25 import BM25Index, load_bm25
+from src.engine.cache import cache_from_env, normalize_query
+from src.engine.chunking import extract_keywords
+from src.engine.columnar import (
+    COLUMNS_DIR,
+    EMBEDDINGS_NAME,
+    STRING_COLUMNS,
+    TEXT_COLUMN,
+    ColumnTable,
+    load_array,
+    load_icd_hierarchy,
+    load_string_column,
+)
+from src.engine.encoder import load_encoder
+from src.engine.icd import IcdHierarchy
+from src.engine.indexing import (
+    CURRENT_FILE,
+    FAISS_NAME,
+    MANIFEST_NAME,
+    META_NAME,
+    load_manifest,
+    resolve_index_dir,
+)
+from src.engine.metrics import Timings
+from src.engine.rank import aggregate_by_group, top_chunks
+from src.engine.rerank import RERANK, RERANK_TOP_N, reranker
 
-DATA_DIR = Path("data/test_set")
+log = logging.getLogger(__name__)
+
+INDEX_DIR = Path(os.getenv("INDEX_DIR", "data/index"))
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+TOP_CHUNKS = 20
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))
+# queries per similarity block in retrieve_many: bounds the (queries x chunks) score matrix
+SIM_BLOCK = int(os.getenv("SIM_BLOCK", "256"))
+# ANN candidates per query, rescored exactly against the flat vectors
+ANN_SEARCH_K = int(os.getenv("ANN_SEARCH_K", "200"))
+# 0: rank candidates by the ANN index's own (approximate / quantized) scores
+ANN_RERANK = os.getenv("ANN_RERANK", "1") != "0"
+# how the lexical signal joins the dense one when the version has a BM25 index:
+# rrf (reciprocal-rank fusion), weighted (DENSE_WEIGHT * cosine + rest * BM25 / max BM25),
+# boost (the 0.1 * shared-keyword boost, as for versions without BM25)
+FUSION = os.getenv("FUSION", "rrf")
+RRF_K = int(os.getenv("RRF_K", "60"))
+DENSE_WEIGHT = float(os.getenv("DENSE_WEIGHT", "0.7"))
+# dense and lexical candidates per query that enter the fusion
+FUSION_DEPTH = int(os.getenv("FUSION_DEPTH", "100"))
+# score per ICD code (code) or per category, sibling codes pooled (category)
+ICD_ROLLUP = os.getenv("ICD_ROLLUP", "code")
+# search-time overrides of the tunables persisted in the manifest
+ANN_OVERRIDES = {
+    "nprobe": os.getenv("ANN_NPROBE"),
+    "efSearch": os.getenv("ANN_EF_SEARCH"),
+}
+
+# IO_FLAG_MMAP_IFC maps flat codes too (faiss >= 1.9); older builds only know IO_FLAG_MMAP
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+@dataclass(eq=False)
+class IndexSnapshot:
+    """
+    Everything a request needs from one index version. Never mutated after
+    load: a request takes one reference at its start and uses it throughout,
+    so a hot swap can't mix versions inside a request.
+    """
+
+    path: Path
+    version: str  # content hash of the version
+    info: Dict  # index type + tunables from the manifest
+    corpus: Sequence[Dict]  # metadata rows: mapped columns, or JSON records for older builds
+    index: Any  # mapped faiss index backing `embeddings` (older builds only)
+    embeddings: np.ndarray  # float32 rows; decoded from `ann` in versions without a float32 copy
+    ann: Any  # ANN / quantized index (non-flat builds); None means exact flat scan
+    # inverted keyword index (CSR) over sorted terms:
+    # postings of vocab[t] are postings[postings_ptr[t]:postings_ptr[t + 1]]
+    vocab: Sequence[str] = field(repr=False)
+    postings_ptr: np.ndarray = field(repr=False)
+    postings: np.ndarray = field(repr=False)
+    # vector -> ICD ids side table (CSR): codes of vector v are vec_icd[vec_icd_ptr[v]:vec_icd_ptr[v + 1]]
+    icd_codes: Sequence[str] = field(repr=False)
+    vec_icd_ptr: np.ndarray = field(repr=False)
+    vec_icd: np.ndarray = field(repr=False)
+    # chapter -> block -> category -> subcategory tree over icd_codes
+    icd: IcdHierarchy = field(repr=False)
+    # full chunk texts for the reranker; None: read from the corpus rows
+    texts: Optional[Sequence[str]] = field(default=None, repr=False)
+    bm25: Optional[BM25Index] = field(default=None, repr=False)  # versions built with a BM25 index
+
+
+_ACTIVE: Optional[IndexSnapshot] = None
+_LOAD_LOCK = threading.Lock()
+
+# query encoder (ENCODER_BACKEND=torch | onnx, see src/engine/encoder.py); loaded on first use
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+
+# normalized query text -> query embedding
+embedding_cache = cache_from_env("EMBEDDING_CACHE", maxsize=10_000, ttl_s=3600)
+
+
+class QuantizedRows:
+    """
+    Row access to the vectors of a quantized index (fp16 / int8) for versions
+    built without embeddings.npy: rows are decoded on demand, never the whole matrix.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.shape = (index.ntotal, index.d)
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def __getitem__(self, ids) -> np.ndarray:
+        return self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+
+def _load_columnar(index_dir: Path, ann=None) -> Dict:
+    """
+    Builds with columnar metadata: every array is mapped read-only, so all
+    workers of a pre-forked server share the same pages.
+    """
+    col_dir = index_dir / COLUMNS_DIR
+    if (index_dir / EMBEDDINGS_NAME).exists():
+        embeddings = np.load(index_dir / EMBEDDINGS_NAME, mmap_mode="r")
+    else:
+        embeddings = QuantizedRows(ann)
+    corpus = ColumnTable({name: load_string_column(col_dir, name) for name in STRING_COLUMNS})
+    if len(embeddings) != len(corpus):
+        raise RuntimeError(
+            f"Index/metadata mismatch: {len(embeddings)} vectors vs {len(corpus)} records"
+        )
+    version = hashlib.sha1(
+        index_dir.name.encode("utf-8") + (index_dir / MANIFEST_NAME).read_bytes()
+    ).hexdigest()[:12]
+    icd_codes = load_string_column(col_dir, "icd_codes")
+    return {
+        "version": version,
+        "corpus": corpus,
+        "index": None,
+        "embeddings": embeddings,
+        "vocab": load_string_column(col_dir, "vocab"),
+        "postings_ptr": load_array(col_dir, "postings_ptr"),
+        "postings": load_array(col_dir, "postings"),
+        "icd_codes": icd_codes,
+        "vec_icd_ptr": load_array(col_dir, "vec_icd_ptr"),
+        "vec_icd": load_array(col_dir, "vec_icd"),
+        "icd": load_icd_hierarchy(col_dir, icd_codes),
+        "texts": (
+            load_string_column(col_dir, TEXT_COLUMN)
+            if (col_dir / f"{TEXT_COLUMN}.bin").exists()
+            else None
+        ),
+    }
+
 
-model = SentenceTransformer(MODEL_NAME)
+def _load_json(index_dir: Path) -> Dict:
+    """Builds without columns: mapped faiss vectors + metadata.json parsed per process."""
+    index = faiss.read_index(str(index_dir / FAISS_NAME), _MMAP_FLAGS)
+    raw_meta = (index_dir / META_NAME).read_bytes()
+    meta = json.loads(raw_meta)
+    if index.ntotal != len(meta):
+        raise RuntimeError(
+            f"Index/metadata mismatch: {index.ntotal} vectors vs {len(meta)} records"
+        )
+
+    vocab, postings_ptr, postings = _build_term_index(meta)
+    for m in meta:
+        m.pop("keywords", None)
+    icd_codes, vec_icd_ptr, vec_icd = _build_icd_groups(meta)
+    return {
+        "version": hashlib.sha1(raw_meta).hexdigest()[:12],
+        "corpus": meta,
+        "index": index,
+        "embeddings": flat_vectors(index),
+        "vocab": vocab,
+        "postings_ptr": postings_ptr,
+        "postings": postings,
+        "icd_codes": icd_codes,
+        "vec_icd_ptr": vec_icd_ptr,
+        "vec_icd": vec_icd,
+        "icd": IcdHierarchy.build(icd_codes),
+    }
 
-CHUNK_SIZE = 400
-CHUNK_OVERLAP = 100
 
-_CORPUS = []
-_EMBEDDINGS = None
+def load_snapshot(index_dir: Path) -> IndexSnapshot:
+    manifest = load_manifest(index_dir) or {}
+    info = manifest.get("index") or {"type": "flat", "params": {}}
+    # --no-float32 builds: the quantized index is the only copy of the vectors
+    float32 = info.get("float32", True)
+    columnar = (index_dir / COLUMNS_DIR).is_dir() and (
+        (index_dir / EMBEDDINGS_NAME).exists() or not float32
+    )
+    if not columnar and not ((index_dir / FAISS_NAME).exists() and (index_dir / META_NAME).exists()):
+        raise RuntimeError(
+            f"Index not found in {index_dir}. Run build_index.py first."
+        )
 
+    ann = None
+    if info["type"] != "flat":
+        ann = faiss.read_index(str(index_dir / ANN_NAME), _MMAP_FLAGS)
+        params = {**info["params"]}
+        params.update({k: int(v) for k, v in ANN_OVERRIDES.items() if v and k in params})
+        set_search_params(ann, params)
+        info = {**info, "params": params}
 
-def chunk_text(text: str) -> List[str]:
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i : i + CHUNK_SIZE]
-        chunks.append(" ".join(chunk))
-        i += CHUNK_SIZE - CHUNK_OVERLAP
-    return chunks
+    loaded = _load_columnar(index_dir, ann) if columnar else _load_json(index_dir)
+    return IndexSnapshot(path=index_dir, info=info, ann=ann, bm25=load_bm25(index_dir), **loaded)
 
 
-def extract_keywords(text: str) -> set:
-    tokens = re.findall(r"[а-яa-z]{4,}", text.lower())
-    return set(tokens)
+def current() -> IndexSnapshot:
+    """The served snapshot; loaded on first use."""
+    global _ACTIVE
+    snap = _ACTIVE
+    if snap is None:
+        with _LOAD_LOCK:
+            if _ACTIVE is None:
+                _ACTIVE = load_snapshot(resolve_index_dir(INDEX_DIR))
+            snap = _ACTIVE
+    return snap
 
 
 def load_corpus():
-    global _CORPUS, _EMBEDDINGS
-    if _CORPUS:
-        return
+    current()
 
-    texts = []
-    meta = []
 
-    for file in DATA_DIR.glob("*.json"):
-        with open(file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+def encoder():
+    """The query encoder; loaded on first use, so importing this module stays cheap."""
+    global _MODEL
+    model = _MODEL
+    if model is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                _MODEL = load_encoder(MODEL_NAME)
+            model = _MODEL
+    return model
 
-        gt = data["gt"]
-        protocol_text = data["text"]
 
-        chunks = chunk_text(protocol_text)
-        for chunk in chunks:
-            texts.append(chunk)
-            meta.append(
-                {
-                    "icd10_code": gt,
-                    "text": chunk,
-                    "keywords": extract_keywords(chunk),
-                }
-            )
+def is_loaded() -> bool:
+    return _MODEL is not None and _ACTIVE is not None
 
-    _EMBEDDINGS = model.encode(texts, normalize_embeddings=True)
-    _CORPUS.extend(meta)
 
+def reload(force: bool = False) -> Dict:
+    """
+    Loads the version CURRENT points at and swaps it in with one reference
+    assignment. In-flight requests keep the snapshot they started with; the
+    old version is released (and unmapped) when the last of them finishes.
+    """
+    global _ACTIVE
+    with _LOAD_LOCK:
+        old = _ACTIVE
+        target = resolve_index_dir(INDEX_DIR)
+        if old is not None and old.path == target and not force:
+            return {"reloaded": False, "path": str(target), "version": old.version}
 
-def keyword_boost(query: str, chunk_keywords: set) -> float:
-    q_keywords = extract_keywords(query)
-    overlap = q_keywords & chunk_keywords
-    return 0.1 * len(overlap)
+        snap = load_snapshot(target)
+        _ACTIVE = snap
 
+    if old is not None:
+        weakref.finalize(old, log.info, "index %s (%s) drained and released", old.path.name, old.version)
+    log.info("serving index %s (%s)", snap.path.name, snap.version)
+    return {
+        "reloaded": True,
+        "path": str(snap.path),
+        "version": snap.version,
+        "previous": old.version if old is not None else None,
+    }
 
-def retrieve(query: str, top_k: int = 3) -> List[Dict]:
-    load_corpus()
 
-    q_emb = model.encode([query], normalize_embeddings=True)
-    sims = cosine_similarity(q_emb, _EMBEDDINGS)[0]
+class IndexWatcher:
+    """Polls <INDEX_DIR>/CURRENT and hot-swaps to the new version in the background."""
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _pointer(self) -> Optional[str]:
+        try:
+            return (INDEX_DIR / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+
+    def _run(self) -> None:
+        seen = self._pointer()
+        while not self._stop.wait(self.interval_s):
+            pointer = self._pointer()
+            if pointer == seen:
+                continue
+            seen = pointer
+            try:
+                reload()
+            except Exception:
+                # broken version: keep serving the old one until CURRENT moves again
+                log.exception("index reload failed, still serving the previous version")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def index_info() -> Dict:
+    """Index type and tunables of the served index (from its manifest)."""
+    return current().info
+
+
+def index_version() -> str:
+    """Content hash of the served index metadata; changes whenever the index does."""
+    return current().version
+
+
+def _build_term_index(meta: List[Dict]):
+    """
+    Inverted index over chunk keywords in CSR form:
+    postings of term t are postings[ptr[t]:ptr[t + 1]].
+    """
+    vocab: Dict[str, int] = {}
+    term_ids = []
+    chunk_ids = []
+    for i, m in enumerate(meta):
+        for kw in m.get("keywords") or ():
+            term_ids.append(vocab.setdefault(kw, len(vocab)))
+            chunk_ids.append(i)
+
+    # renumber terms in sorted order, as the columnar build stores them
+    terms = sorted(vocab)
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[[vocab[t] for t in terms]] = np.arange(len(terms))
+    term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+    order = np.argsort(term_ids, kind="stable")
+    ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=ptr[1:])
+
+    return terms, ptr, np.asarray(chunk_ids, dtype=np.int32)[order]
+
 
-    scores = []
-    for i, sim in enumerate(sims):
-        boost = keyword_boost(query, _CORPUS[i]["keywords"])
-        scores.append(sim + boost)
+def _build_icd_groups(meta: List[Dict]):
+    """vector -> ICD ids side table so code expansion and aggregation run on NumPy."""
+    ids: Dict[str, int] = {}
+    lens = np.empty(len(meta), dtype=np.int64)
+    flat = []
+    for i, m in enumerate(meta):
+        # legacy metadata: one record per (text, code) with a scalar icd10_code
+        codes = m.get("icd10_codes") if "icd10_codes" in m else [m.get("icd10_code", "")]
+        codes = codes or [""]
+        lens[i] = len(codes)
+        flat.extend(ids.setdefault(c, len(ids)) for c in codes)
 
-    top_idx = np.argsort(scores)[::-1][:20]
+    ptr = np.zeros(len(meta) + 1, dtype=np.int64)
+    np.cumsum(lens, out=ptr[1:])
+    return list(ids), ptr, np.asarray(flat, dtype=np.int32)
 
-    agg = defaultdict(list)
-    for i in top_idx:
-        icd = _CORPUS[i]["icd10_code"]
-        agg[icd].append(scores[i])
 
-    ranked = sorted(
-        agg.items(), key=lambda x: np.mean(x[1]), reverse=True
-    )[:top_k]
+def _expand_codes(snap: IndexSnapshot, top_idx: np.ndarray, top_scores: np.ndarray, n_slots: int):
+    """
+    One (vector, ICD, score) slot per code of each top vector, best vector first,
+    cut to n_slots: the same slots one-chunk-per-code indexing used to return.
+    The codes of a vector tie, and come last-listed first, as the tied rows of
+    one protocol did out of top_chunks; so the same codes survive the cut.
+    """
+    starts = snap.vec_icd_ptr[top_idx]
+    lens = snap.vec_icd_ptr[top_idx + 1] - starts
+    slot_vec = np.repeat(top_idx, lens)
+    slot_scores = np.repeat(top_scores, lens)
+    offsets = np.repeat(starts + np.cumsum(lens) - 1, lens) - np.arange(lens.sum())
+    return slot_vec[:n_slots], snap.vec_icd[offsets[:n_slots]], slot_scores[:n_slots]
+
+
+def warmup() -> None:
+    """Load the index and run one encode (and rerank) so the first request pays no init cost."""
+    current()
+    encoder().encode(["warmup"], normalize_embeddings=True)
+    if RERANK:
+        reranker.warmup()
+
+
+def _term_id(vocab: Sequence[str], term: str) -> Optional[int]:
+    i = bisect.bisect_left(vocab, term)
+    return i if i < len(vocab) and vocab[i] == term else None
+
+
+def keyword_boost(snap: IndexSnapshot, query: str) -> np.ndarray:
+    """
+    0.1 * |query keywords & chunk keywords| for every chunk at once:
+    a sparse mat-vec touching only the postings of the query's terms.
+    """
+    n = len(snap.corpus)
+    boost = np.zeros(n, dtype=np.float64)
+    term_ids = [t for t in (_term_id(snap.vocab, kw) for kw in extract_keywords(query)) if t is not None]
+    if not term_ids:
+        return boost
+
+    ptr, postings = snap.postings_ptr, snap.postings
+    hits = np.concatenate([postings[ptr[t] : ptr[t + 1]] for t in term_ids])
+    boost += 0.1 * np.bincount(hits, minlength=n)
+    return boost
+
+
+def _fuse(
+    snap: IndexSnapshot,
+    query: str,
+    q: np.ndarray,
+    sims: np.ndarray,
+    cand: np.ndarray | None,
+    timings: Timings,
+):
+    """
+    (chunk positions, fused scores) of the dense top FUSION_DEPTH and the
+    BM25 top FUSION_DEPTH, merged by FUSION. Both fusions score in [0, 1]
+    (1: best in both lists), the scale the rule engine's boosts expect.
+    """
+    with timings.stage("lexical"):
+        lex_ids, lex_scores = snap.bm25.search_text(query)
+        sel = top_chunks(lex_scores, FUSION_DEPTH)
+        lex_ids, lex_scores = lex_ids[sel], lex_scores[sel]
+
+    sel = top_chunks(sims, FUSION_DEPTH)
+    dense_ids = sel if cand is None else cand[sel]
+    dense_scores = sims[sel].astype(np.float64)
+
+    if FUSION == "weighted":
+        ids = np.union1d(dense_ids, lex_ids)
+        if cand is None:
+            dense = sims[ids].astype(np.float64)
+        else:
+            # lexical hits outside the ANN candidates: cosine from their rows
+            # (decoded from the quantized index in versions without float32 vectors)
+            dense = (snap.embeddings[ids] @ q).astype(np.float64)
+            dense[np.searchsorted(ids, dense_ids)] = dense_scores
+        lexical = np.zeros(len(ids))
+        if len(lex_ids):
+            lexical[np.searchsorted(ids, lex_ids)] = lex_scores / lex_scores[0]
+        return ids, DENSE_WEIGHT * dense + (1.0 - DENSE_WEIGHT) * lexical
+
+    # rrf: sum of 1 / (RRF_K + rank) over the lists a chunk appears in
+    ids = np.concatenate([dense_ids, lex_ids])
+    contrib = np.concatenate(
+        [1.0 / (RRF_K + 1 + np.arange(len(dense_ids))), 1.0 / (RRF_K + 1 + np.arange(len(lex_ids)))]
+    )
+    uniq, inv = np.unique(ids, return_inverse=True)
+    return uniq, np.bincount(inv, weights=contrib) * (RRF_K + 1) / 2.0
+
+
+def _candidates(
+    snap: IndexSnapshot,
+    query: str,
+    sims: np.ndarray,
+    n: int,
+    cand: np.ndarray | None = None,
+    timings: Optional[Timings] = None,
+    q: np.ndarray | None = None,
+):
+    """
+    (chunk positions, scores) of the n best chunks, best first: fused with
+    BM25 or keyword-boosted. sims: dense similarity per chunk, or per
+    candidate when `cand` (chunk positions from the ANN search) is given.
+    q: the query embedding.
+    """
+    timings = timings if timings is not None else Timings()
+    t0 = time.perf_counter()
+    if snap.bm25 is not None and FUSION != "boost":
+        ids, fused = _fuse(snap, query, q, sims, cand, timings)
+        t1 = time.perf_counter()
+        sel = top_chunks(fused, n)
+        top_idx, top_scores = ids[sel], fused[sel]
+    else:
+        boost = keyword_boost(snap, query)
+        scores = sims.astype(np.float64) + (boost if cand is None else boost[cand])
+        t1 = time.perf_counter()
+        timings.add("boost", t1 - t0)
+        sel = top_chunks(scores, n)
+        top_idx = sel if cand is None else cand[sel]
+        top_scores = scores[sel]
+    timings.add("aggregate", time.perf_counter() - t1)
+    return top_idx, top_scores
+
+
+def _chunk_text(snap: IndexSnapshot, pos: int) -> str:
+    if snap.texts is not None:
+        return snap.texts[pos]
+    row = snap.corpus[pos]
+    return row.get("text") or row.get("text_preview") or ""
+
+
+def _rerank(snap: IndexSnapshot, queries: List[str], ranked: List[tuple]) -> List[tuple]:
+    """
+    Top TOP_CHUNKS per query by cross-encoder score where the reranker's
+    budget allowed, by the bi-encoder order otherwise.
+    """
+    scores = reranker.score(
+        queries, [idx for idx, _ in ranked], lambda pos: _chunk_text(snap, pos), version=snap.version
+    )
+    out = []
+    for (idx, bi), ce in zip(ranked, scores):
+        if ce is None:
+            out.append((idx[:TOP_CHUNKS], bi[:TOP_CHUNKS]))
+        else:
+            sel = top_chunks(ce, TOP_CHUNKS)
+            out.append((idx[sel], ce[sel]))
+    return out
+
+
+def _aggregate(
+    snap: IndexSnapshot,
+    top_idx: np.ndarray,
+    top_scores: np.ndarray,
+    top_k: int,
+    timings: Optional[Timings] = None,
+) -> List[Dict]:
+    """Top-k ICD codes (or categories, see ICD_ROLLUP) by mean score over the top chunks."""
+    timings = timings if timings is not None else Timings()
+    t0 = time.perf_counter()
+    # every vector carries >= 1 code, so TOP_CHUNKS vectors always fill TOP_CHUNKS slots
+    slot_vec, slot_icd, slot_scores = _expand_codes(snap, top_idx, top_scores, TOP_CHUNKS)
+    # normalized code node per slot; with ICD_ROLLUP=category sibling codes
+    # pool their slots and the category is reported as its best code
+    slot_node = snap.icd.code_node[slot_icd]
+    groups = snap.icd.code_category[slot_icd] if ICD_ROLLUP == "category" else slot_node
+    _, means, counts, first = aggregate_by_group(
+        np.arange(len(slot_vec)), slot_scores, groups, top_k
+    )
 
     results = []
-    for rank, (icd, score_list) in enumerate(ranked, start=1):
+    for rank, (mean, count, pos) in enumerate(zip(means, counts, first), start=1):
+        icd = snap.icd.labels[slot_node[pos]]
+        chunk = snap.corpus[slot_vec[pos]]
         results.append(
             {
                 "rank": rank,
-                "diagnosis": icd,
+                "diagnosis": chunk.get("diagnosis") or icd,
                 "icd10_code": icd,
-                "explanation": f"Matched via {len(score_list)} relevant protocol fragments",
+                "explanation": f"Matched via {count} relevant protocol fragments",
+                "score": float(mean),
+                "protocol_id": chunk.get("protocol_id", ""),
             }
         )
 
-    return results
\ No newline at end of file
+    timings.add("aggregate", time.perf_counter() - t0)
+    return results
+
+
+def encode_queries(queries: List[str], version: Optional[str] = None) -> np.ndarray:
+    """
+    Embeddings for `queries`, served from the embedding cache where possible.
+    The normalized form is only the cache key: the encoder sees the query as
+    typed, and all misses go to it in one batched call. Spellings that differ
+    only in case or whitespace share one entry, so while it is cached they all
+    get the embedding of the spelling that was encoded first (the first of
+    the batch that missed); the bi-encoder barely tells them apart.
+    """
+    keys = [normalize_query(q) for q in queries]
+    cached = [embedding_cache.get(k, version=version) for k in keys]
+
+    # key -> the query text encoded for it
+    missing: Dict[str, str] = {}
+    for q, k, e in zip(queries, keys, cached):
+        if e is None:
+            missing.setdefault(k, q)
+    if missing:
+        embs = encoder().encode(
+            list(missing.values()), batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True
+        )
+        fresh = {k: np.array(e) for k, e in zip(missing, embs)}
+        for k, e in fresh.items():
+            e.flags.writeable = False
+            embedding_cache.put(k, e, version=version)
+        cached = [e if e is not None else fresh[k] for k, e in zip(keys, cached)]
+
+    return np.stack(cached)
+
+
+def search_many(
+    snap: IndexSnapshot,
+    queries: List[str],
+    q_embs: np.ndarray,
+    top_k: int = 3,
+    timings: Optional[Timings] = None,
+) -> List[List[Dict]]:
+    """
+    Search + rank for already encoded queries: one matrix-matrix similarity
+    per block of SIM_BLOCK queries. Results are returned in input order.
+    With RERANK=1 the cross-encoder re-scores each block's top chunks in one pass.
+    Stage times (similarity, lexical or boost, rerank, aggregate) are added to `timings`.
+    """
+    timings = timings if timings is not None else Timings()
+    # chunks per query: the cross-encoder picks TOP_CHUNKS out of RERANK_TOP_N
+    n = max(TOP_CHUNKS, RERANK_TOP_N) if RERANK else TOP_CHUNKS
+    results = []
+    for start in range(0, len(queries), SIM_BLOCK):
+        block = q_embs[start : start + SIM_BLOCK]
+        block_queries = queries[start : start + SIM_BLOCK]
+
+        if snap.ann is None:
+            with timings.stage("similarity"):
+                # both sides are L2-normalized: the dot product is the cosine
+                sims = block @ snap.embeddings.T
+            ranked = [
+                _candidates(snap, query, row, n, timings=timings, q=q)
+                for query, q, row in zip(block_queries, block, sims)
+            ]
+        else:
+            with timings.stage("similarity"):
+                dists, cands = snap.ann.search(np.ascontiguousarray(block, dtype=np.float32), ANN_SEARCH_K)
+            ranked = []
+            for query, q, cand, dist in zip(block_queries, block, cands, dists):
+                with timings.stage("similarity"):
+                    found = cand >= 0
+                    cand = cand[found]
+                    # exact float32 rescoring of the candidates: touches only their rows of the mapped matrix
+                    rescore = ANN_RERANK and snap.info.get("float32", True)
+                    sims = snap.embeddings[cand] @ q if rescore else dist[found]
+                ranked.append(_candidates(snap, query, sims, n, cand=cand, timings=timings, q=q))
+
+        if RERANK:
+            with timings.stage("rerank"):
+                ranked = _rerank(snap, block_queries, ranked)
+        results.extend(_aggregate(snap, idx, scores, top_k, timings) for idx, scores in ranked)
+    return results
+
+
+def retrieve_many(
+    queries: List[str], top_k: int = 3, timings: Optional[Timings] = None
+) -> List[List[Dict]]:
+    """Batched retrieve(): one encoder call for all queries, then search_many()."""
+    timings = timings if timings is not None else Timings()
+    snap = current()
+    if not queries:
+        return []
+    with timings.stage("encode"):
+        q_embs = encode_queries(queries, version=snap.version)
+    return search_many(snap, queries, q_embs, top_k, timings)
+
+
+def retrieve(query: str, top_k: int = 3) -> List[Dict]:
+    return retrieve_many([query], top_k=top_k)[0]
@@ -0,0 +1,122 @@
+"""
+Light suffix-stripping stemmer for Russian and Kazakh, and the analyzer the
+BM25 index is built and queried with. Rules are deliberately conservative
+(inflectional endings only, a minimum stem length) so that different forms
+of a clinical term meet on one stem without merging unrelated words.
+"""
+import re
+from functools import lru_cache
+from typing import List
+
+# bump when tokenization or stemming changes: BM25 indexes of another version are not used
+ANALYZER_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-яёәғқңөұүһі]+")
+_KZ_LETTERS = frozenset("әғқңөұүһі")
+_RU_VOWELS = frozenset("аеиоуыэюя")
+
+_RU_REFLEXIVE = ("ся", "сь")
+# adjective, participle and noun endings, longest first
+_RU_ENDINGS = tuple(sorted(
+    {
+        "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий",
+        "ый", "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+        "ующ", "ивш", "ывш", "енн",
+        "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ье", "еи",
+        "ии", "ям", "ам", "ах", "ях", "ию", "ью", "ия", "ья",
+        "а", "е", "и", "о", "у", "ы", "ь", "ю", "я",
+    },
+    key=len,
+    reverse=True,
+))
+# verb endings long enough not to eat into noun stems ("аппендицит", "боли")
+_RU_VERB_ENDINGS = tuple(sorted(
+    {
+        "ившись", "ывшись", "вшись", "ивши", "ывши",
+        "ила", "ыла", "ило", "ыло", "или", "ыли", "ить", "ыть", "ишь",
+        "ует", "уют", "ейте", "уйте", "ите", "ена", "ено", "ены",
+    },
+    key=len,
+    reverse=True,
+))
+# verb endings only stripped after а / я, which stays
+_RU_VERB_AFTER_A = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть")
+_RU_DERIVATIONAL = ("ость", "ост")
+
+# case, possessive and plural endings, stripped from the end inwards, longest first
+_KZ_ENDINGS = tuple(sorted(
+    {
+        "ның", "нің", "дың", "дің", "тың", "тің",
+        "ға", "ге", "қа", "ке", "на", "не",
+        "ны", "ні", "ды", "ді", "ты", "ті",
+        "да", "де", "та", "те", "нда", "нде",
+        "дан", "ден", "тан", "тен", "нан", "нен",
+        "мен", "бен", "пен",
+        "ымыз", "іміз", "мыз", "міз", "ыңыз", "іңіз", "ңыз", "ңіз",
+        "ым", "ім", "ың", "ің", "сы", "сі",
+        "лар", "лер", "дар", "дер", "тар", "тер",
+    },
+    key=len,
+    reverse=True,
+))
+_KZ_MIN_STEM = 3
+# 3rd person possessive -ы / -і: only off longer words
+_KZ_POSSESSIVE = ("ы", "і")
+_KZ_POSSESSIVE_MIN_STEM = 4
+
+
+def _rv(word: str) -> int:
+    """Start of the Russian RV region: after the first vowel."""
+    for i, ch in enumerate(word):
+        if ch in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word: str, suffixes, start: int) -> str:
+    for s in suffixes:
+        if word.endswith(s) and len(word) - len(s) >= start:
+            return word[: -len(s)]
+    return word
+
+
+def _stem_ru(word: str) -> str:
+    rv = max(_rv(word), 2)
+    word = _strip(word, _RU_REFLEXIVE, rv)
+    stripped = _strip(word, _RU_VERB_ENDINGS, rv)
+    if stripped == word:
+        for s in _RU_VERB_AFTER_A:
+            if word.endswith(s) and word[-len(s) - 1 : -len(s)] in ("а", "я") and len(word) - len(s) >= rv:
+                stripped = word[: -len(s)]
+                break
+    if stripped == word:
+        stripped = _strip(word, _RU_ENDINGS, rv)
+    word = stripped
+    word = _strip(word, _RU_DERIVATIONAL, rv)
+    if word.endswith("нн"):
+        word = word[:-1]
+    return word
+
+
+def _stem_kz(word: str) -> str:
+    for _ in range(3):
+        stripped = _strip(word, _KZ_ENDINGS, _KZ_MIN_STEM)
+        if stripped == word:
+            break
+        word = stripped
+    return _strip(word, _KZ_POSSESSIVE, _KZ_POSSESSIVE_MIN_STEM)
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    word = word.replace("ё", "е")
+    if len(word) <= 3 or word.isascii():
+        return word
+    if not _KZ_LETTERS.isdisjoint(word):
+        return _stem_kz(word)
+    return _stem_ru(word)
+
+
+def analyze(text: str) -> List[str]:
+    """Lowercased, stemmed word tokens of `text`, in order; single characters are dropped."""
+    return [stem(t) for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
@@ -0,0 +1,356 @@
+"""
+Async client for the local GPT-OSS endpoint, used for follow-up question
+generation.
+
+GPT_OSS_URL is the full completions endpoint, as before: requests post
+{"prompt", "max_tokens", "temperature", "stream": true} and the answer is
+read from "text" / choices[0]["text"], either streamed as server-sent
+events or as one JSON body from servers that don't stream.
+
+One pooled HTTP/1.1 keep-alive session per event loop; responses are streamed
+token by token. Identical prompts already in flight share one upstream call,
+which is cancelled once every caller waiting on it has given up. At most
+GPT_OSS_MAX_CONCURRENCY calls run at once, and a circuit breaker answers with
+FALLBACK_QUESTIONS straight away while the endpoint is failing or slow.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+GPT_OSS_URL = os.getenv("GPT_OSS_URL", "").strip()
+# sent as "model" only when set; the endpoint serves a single model otherwise
+GPT_OSS_MODEL = os.getenv("GPT_OSS_MODEL", "")
+GPT_OSS_MAX_TOKENS = int(os.getenv("GPT_OSS_MAX_TOKENS", "200"))
+GPT_OSS_TEMPERATURE = float(os.getenv("GPT_OSS_TEMPERATURE", "0.2"))
+# upstream calls at once; keep-alive connections kept in the pool
+GPT_OSS_MAX_CONCURRENCY = int(os.getenv("GPT_OSS_MAX_CONCURRENCY", "4"))
+GPT_OSS_MAX_CONNECTIONS = int(os.getenv("GPT_OSS_MAX_CONNECTIONS", "8"))
+GPT_OSS_CONNECT_TIMEOUT_S = float(os.getenv("GPT_OSS_CONNECT_TIMEOUT_S", "2"))
+GPT_OSS_TIMEOUT = float(os.getenv("GPT_OSS_TIMEOUT", "25"))
+# a caller waits at most this long for its questions before getting the fallback
+GPT_OSS_DEADLINE_S = float(os.getenv("GPT_OSS_DEADLINE_S", "8"))
+# calls slower than this count as failures for the breaker
+GPT_OSS_SLOW_S = float(os.getenv("GPT_OSS_SLOW_S", "8"))
+# consecutive failures that open the breaker / seconds before it lets a probe through
+GPT_OSS_BREAKER_FAILURES = int(os.getenv("GPT_OSS_BREAKER_FAILURES", "3"))
+GPT_OSS_BREAKER_COOLDOWN_S = float(os.getenv("GPT_OSS_BREAKER_COOLDOWN_S", "30"))
+
+FALLBACK_QUESTIONS = [
+    "Когда начались симптомы?",
+    "Есть ли повышение температуры или давления?",
+    "Есть ли ухудшение состояния со временем?",
+]
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CallCancelled(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After `failures` consecutive failed or slow
+    calls it opens and rejects calls for `cooldown_s`; then one probe call is
+    let through (half-open), whose outcome closes or re-opens it.
+    """
+
+    def __init__(self, failures: int, cooldown_s: float, slow_s: float):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.slow_s = slow_s
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, ok: bool, elapsed_s: float) -> None:
+        self._probing = False
+        if ok and elapsed_s <= self.slow_s:
+            self.consecutive = 0
+            self.opened_at = None
+            return
+        self.consecutive += 1
+        if self.opened_at is not None or self.consecutive >= self.failures:
+            if self.opened_at is None:
+                log.warning("GPT-OSS circuit opened after %d failed or slow calls", self.consecutive)
+            self.opened_at = time.monotonic()
+
+
+class _Shared:
+    """Tokens of one upstream call, replayed to every caller that joined it."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def push(self, token: str) -> None:
+        async with self._changed:
+            self.tokens.append(token)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        i = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.tokens) > i or self.done)
+                new = self.tokens[i:]
+                finished, error = self.done, self.error
+            for token in new:
+                yield token
+            i += len(new)
+            if finished and i == len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class GptOssClient:
+    """
+    Completions over a pooled keep-alive session. The session is created on
+    first use inside the running event loop, and again when the client is
+    used from another loop (a later asyncio.run, a forked worker): a session
+    cannot outlive the loop it was opened on.
+    """
+
+    def __init__(
+        self,
+        url: str = GPT_OSS_URL,
+        model: str = GPT_OSS_MODEL,
+        max_concurrency: int = GPT_OSS_MAX_CONCURRENCY,
+        max_connections: int = GPT_OSS_MAX_CONNECTIONS,
+        timeout_s: float = GPT_OSS_TIMEOUT,
+        connect_timeout_s: float = GPT_OSS_CONNECT_TIMEOUT_S,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.url = url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = httpx.Timeout(timeout_s, connect=connect_timeout_s)
+        self.breaker = breaker or CircuitBreaker(
+            GPT_OSS_BREAKER_FAILURES, GPT_OSS_BREAKER_COOLDOWN_S, GPT_OSS_SLOW_S
+        )
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, _Shared] = {}
+
+    def _session(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            # the session of another loop is dropped, not closed: its loop may be gone
+            self._loop = loop
+            self._inflight = {}
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None and self._loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._http = None
+        self._loop = None
+
+    async def stream(
+        self, prompt: str, max_tokens: int = GPT_OSS_MAX_TOKENS, temperature: float = GPT_OSS_TEMPERATURE
+    ) -> AsyncIterator[str]:
+        """
+        Completion text as it arrives. Raises CircuitOpen without calling the
+        endpoint while the breaker is open.
+        """
+        if not self.url:
+            raise RuntimeError(
+                "GPT_OSS_URL is not set. Set env GPT_OSS_URL to the local GPT-OSS endpoint."
+            )
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        if self.model:
+            payload["model"] = self.model
+        http = self._session()
+        key = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpen("GPT-OSS circuit is open")
+            shared = self._inflight[key] = _Shared()
+            shared.task = asyncio.create_task(self._call(http, key, payload, shared))
+            shared.task.add_done_callback(lambda task: self._cancelled_early(shared))
+        shared.waiters += 1
+        try:
+            async for token in shared:
+                yield token
+        finally:
+            shared.waiters -= 1
+            # the last caller gave up (deadline, disconnect): stop the upstream call
+            if not shared.waiters and not shared.done:
+                if self._inflight.get(key) is shared:
+                    del self._inflight[key]
+                shared.task.cancel()
+
+    async def complete(self, prompt: str, **kwargs) -> str:
+        return "".join([t async for t in self.stream(prompt, **kwargs)])
+
+    async def _call(self, http: httpx.AsyncClient, key: str, payload: Dict, shared: _Shared) -> None:
+        error = None
+        t0 = time.monotonic()
+        try:
+            async with self._sem:
+                self.calls += 1
+                t0 = time.monotonic()
+                async with http.stream("POST", self.url, json={**payload, "stream": True}) as resp:
+                    resp.raise_for_status()
+                    if not resp.headers.get("content-type", "").startswith("text/event-stream"):
+                        # endpoint without streaming: the whole answer in one JSON body
+                        text = _completion_text(json.loads(await resp.aread()))
+                        if text:
+                            await shared.push(text)
+                        return
+                    # read to the end (past [DONE]) so the connection goes back to the pool
+                    async for line in resp.aiter_lines():
+                        data = line[5:].strip() if line.startswith("data:") else ""
+                        if not data or data == "[DONE]":
+                            continue
+                        token = _completion_text(json.loads(data))
+                        if token:
+                            await shared.push(token)
+        except asyncio.CancelledError:
+            # waiters must not take a cut-off stream for a complete answer
+            error = CallCancelled("GPT-OSS call was cancelled")
+            raise
+        except Exception as e:
+            error = e
+            log.warning("GPT-OSS call failed: %r", e)
+        finally:
+            self.breaker.record(error is None, time.monotonic() - t0)
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+            await shared.finish(error)
+
+    def _cancelled_early(self, shared: _Shared) -> None:
+        # a call cancelled before it started never reached _call's own bookkeeping
+        if not shared.done:
+            self.breaker.record(False, 0.0)
+            shared.done = True
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "in_flight": len(self._inflight),
+            "breaker": self.breaker.state,
+        }
+
+
+def _completion_text(data: Dict) -> Optional[str]:
+    if isinstance(data, dict) and "text" in data:
+        return data["text"]
+    if isinstance(data, dict) and data.get("choices"):
+        return data["choices"][0].get("text")
+    return None
+
+
+def build_prompt(symptoms: str, n: int = 3) -> str:
+    return (
+        "Ты — клинический ассистент.\n"
+        "На основе описания симптомов задай "
+        f"{n} коротких уточняющих вопросов.\n"
+        "НЕ ставь диагноз.\n"
+        "Верни ТОЛЬКО JSON-массив строк на русском языке.\n\n"
+        f"Симптомы: {symptoms}"
+    )
+
+
+def parse_questions(text: str, n: int = 3) -> Optional[List[str]]:
+    """The JSON array of questions the prompt asks for (possibly empty); None when the answer is not one."""
+    try:
+        arr = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(arr, list):
+        return None
+    return [str(x).strip() for x in arr if str(x).strip()][:n]
+
+
+client = GptOssClient()
+
+
+async def generate_followup_questions(symptoms: str, n: int = 3) -> List[str]:
+    """
+    Использует Kazcode GPT-OSS 120B через ЛОКАЛЬНЫЙ endpoint (без внешних вызовов).
+    Возвращает короткие уточняющие клинические вопросы НА РУССКОМ ЯЗЫКЕ;
+    FALLBACK_QUESTIONS, если breaker открыт, вызов упал, ответ пустой или не
+    JSON-массив, или не пришёл за GPT_OSS_DEADLINE_S. Пустой JSON-массив
+    возвращается как [] (как и раньше).
+    """
+    try:
+        text = await asyncio.wait_for(client.complete(build_prompt(symptoms, n)), GPT_OSS_DEADLINE_S)
+    except (CircuitOpen, CallCancelled, asyncio.TimeoutError, httpx.HTTPError, ValueError) as e:
+        log.info("Follow-up questions from fallback: %r", e)
+        return FALLBACK_QUESTIONS[:n]
+    questions = parse_questions(text, n)
+    return FALLBACK_QUESTIONS[:n] if questions is None else questions
+
+
+async def stream_followup_questions(symptoms: str, n: int = 3) -> AsyncIterator[str]:
+    """
+    The raw answer of generate_followup_questions() (a JSON array) while it
+    arrives. The fallback comes in one piece, as a JSON array, if the call
+    fails before its first token; a stream cut off later just ends.
+    """
+    started = False
+    try:
+        async for token in client.stream(build_prompt(symptoms, n)):
+            started = True
+            yield token
+    except (CircuitOpen, CallCancelled, httpx.HTTPError, ValueError) as e:
+        log.info("Follow-up stream failed: %r", e)
+        if not started:
+            yield json.dumps(FALLBACK_QUESTIONS[:n], ensure_ascii=False)
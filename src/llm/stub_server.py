@@ -0,0 +1,94 @@
+"""
+Local stand-in for the GPT-OSS endpoint: POST /v1/completions with the
+payload src/llm/gpt_oss.py sends ({"prompt", "max_tokens", "stream", ...}),
+answering with a canned JSON array of questions (streamed or not) after a
+configurable delay, optionally failing a share of the calls.
+GET /stats counts the calls it received, e.g. to check request coalescing.
+
+    python -m src.llm.stub_server --port 8001 --delay-ms 200 --token-delay-ms 20
+    GPT_OSS_URL=http://127.0.0.1:8001/v1/completions ...
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+ANSWER = json.dumps(
+    [
+        "Как давно появились симптомы?",
+        "Есть ли повышение температуры?",
+        "Принимаете ли вы какие-либо лекарства?",
+    ],
+    ensure_ascii=False,
+)
+
+
+def create_app(delay_ms: float = 0.0, token_delay_ms: float = 0.0, fail_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="GPT-OSS stub")
+    app.state.config = {"delay_ms": delay_ms, "token_delay_ms": token_delay_ms, "fail_rate": fail_rate}
+    app.state.calls = 0
+
+    @app.get("/stats")
+    def stats():
+        return {"calls": app.state.calls, **app.state.config}
+
+    @app.post("/stats/config")
+    def configure(config: dict):
+        app.state.config.update({k: float(v) for k, v in config.items() if k in app.state.config})
+        return app.state.config
+
+    @app.post("/v1/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        config = app.state.config
+        await asyncio.sleep(config["delay_ms"] / 1000.0)
+        if random.random() < config["fail_rate"]:
+            raise HTTPException(status_code=503, detail="stub failure")
+
+        model = body.get("model", "stub")
+        tokens = re.findall(r"\S+\s*", ANSWER)
+        if not body.get("stream"):
+            return {
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "text": ANSWER, "finish_reason": "stop"}],
+            }
+
+        async def events():
+            for token in tokens:
+                chunk = {
+                    "object": "text_completion",
+                    "model": model,
+                    "choices": [{"index": 0, "text": token}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(config["token_delay_ms"] / 1000.0)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local GPT-OSS stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Wait before the first token")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="Wait between streamed tokens")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of calls answered with 503")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.delay_ms, args.token_delay_ms, args.fail_rate), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
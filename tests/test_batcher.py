@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from src.engine.batcher import BatcherStopped, MicroBatcher
+
+
+def test_results_go_to_their_callers():
+    async def double(payloads):
+        return [p * 2 for p in payloads]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=5)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(main()) == [i * 2 for i in range(10)]
+
+
+@pytest.mark.parametrize(
+    "max_inflight, n",
+    [
+        (1, 5),  # all slots busy: the later requests wait in the queue
+        (2, 4),  # a free slot: the later request sits in a half-collected batch
+    ],
+)
+def test_stop_fails_queued_and_half_collected_requests(max_inflight, n):
+    release = None
+
+    async def blocked(payloads):
+        await release.wait()
+        return payloads
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        batcher = MicroBatcher(blocked, max_batch_size=3, max_wait_ms=10_000, max_inflight=max_inflight)
+        batcher.start()
+        calls = [asyncio.create_task(batcher.submit(i)) for i in range(n)]
+        await asyncio.sleep(0.05)
+        stopping = asyncio.create_task(batcher.stop())
+        await asyncio.sleep(0.05)
+        release.set()
+        await stopping
+        return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+
+    results = asyncio.run(main())
+    # the dispatched batch still answers its callers
+    assert results[:3] == [0, 1, 2]
+    assert results[3:] and all(isinstance(r, BatcherStopped) for r in results[3:])
+
+
+def test_short_result_list_fails_the_unanswered_callers():
+    async def drops_last(payloads):
+        return payloads[:-1]
+
+    async def main():
+        batcher = MicroBatcher(drops_last, max_batch_size=3, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), 1
+        )
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert results[:2] == [0, 1]
+    assert isinstance(results[2], RuntimeError)
+    with pytest.raises(RuntimeError, match="2 results for 3 payloads"):
+        raise results[2]
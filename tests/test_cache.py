@@ -0,0 +1,52 @@
+import numpy as np
+
+from src.engine import retrieve
+from src.engine.cache import TTLCache
+
+
+def test_alternating_versions_keep_both_entries():
+    cache = TTLCache(maxsize=10, ttl_s=60)
+    cache.put("q", "old", version="v1")
+    cache.put("q", "new", version="v2")
+    # a request still running on v1 during a hot-swap, then one on v2
+    assert cache.get("q", version="v1") == "old"
+    assert cache.get("q", version="v2") == "new"
+    assert cache.get("q", version="v1") == "old"
+    assert cache.get("q", version="v3") is None
+
+
+def test_old_versions_are_evicted_by_lru():
+    cache = TTLCache(maxsize=2, ttl_s=60)
+    cache.put("a", 1, version="v1")
+    cache.put("a", 2, version="v2")
+    cache.put("b", 3, version="v2")
+    assert cache.get("a", version="v1") is None
+    assert len(cache) == 2
+
+
+class RecordingEncoder:
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, **kwargs):
+        self.seen.append(list(texts))
+        return np.stack([np.full(4, float(len(self.seen) * 10 + i)) for i in range(len(texts))])
+
+
+def test_spellings_of_one_key_share_the_first_encoded_embedding(monkeypatch):
+    encoder = RecordingEncoder()
+    monkeypatch.setattr(retrieve, "encoder", lambda: encoder)
+    retrieve.embedding_cache.clear()
+
+    first = retrieve.encode_queries(["Сыпь  Зуд", "сыпь зуд", "Кашель"], version="v")
+    # the encoder saw the first spelling as typed, once per key
+    assert encoder.seen == [["Сыпь  Зуд", "Кашель"]]
+    np.testing.assert_array_equal(first[0], first[1])
+
+    later = retrieve.encode_queries(["СЫПЬ ЗУД"], version="v")
+    assert len(encoder.seen) == 1
+    np.testing.assert_array_equal(later[0], first[0])
+
+    # another index version encodes again, from the spelling that comes first then
+    retrieve.encode_queries(["СЫПЬ ЗУД"], version="v2")
+    assert encoder.seen[-1] == ["СЫПЬ ЗУД"]
@@ -0,0 +1,123 @@
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+from src.llm import gpt_oss
+from src.llm.gpt_oss import CircuitBreaker, CircuitOpen, GptOssClient
+from src.llm.stub_server import create_app
+
+
+@pytest.fixture(scope="module")
+def stub():
+    """The stub GPT-OSS server on a free local port, for the whole module."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    base = f"http://127.0.0.1:{port}"
+    yield base
+    server.should_exit = True
+    thread.join(5)
+
+
+def configure(base, **config):
+    config = {"delay_ms": 0, "token_delay_ms": 0, "fail_rate": 0, **config}
+    httpx.post(f"{base}/stats/config", json=config).raise_for_status()
+
+
+def stub_calls(base):
+    return httpx.get(f"{base}/stats").json()["calls"]
+
+
+def make_client(base, **breaker):
+    breaker = {"failures": 3, "cooldown_s": 30.0, "slow_s": 30.0, **breaker}
+    return GptOssClient(f"{base}/v1/completions", breaker=CircuitBreaker(**breaker))
+
+
+def test_identical_prompts_share_one_upstream_call(stub):
+    configure(stub, delay_ms=100, token_delay_ms=5)
+    client = make_client(stub)
+    before = stub_calls(stub)
+
+    async def main():
+        answers = await asyncio.gather(*(client.complete("same prompt") for _ in range(10)))
+        await client.aclose()
+        return answers
+
+    answers = asyncio.run(main())
+    assert len(set(answers)) == 1
+    assert gpt_oss.parse_questions(answers[0])
+    assert stub_calls(stub) - before == 1
+    assert client.coalesced == 9
+
+
+def test_deadline_falls_back_and_cancels_the_upstream_call(stub, monkeypatch):
+    configure(stub, delay_ms=1000)
+    client = make_client(stub)
+    monkeypatch.setattr(gpt_oss, "client", client)
+    monkeypatch.setattr(gpt_oss, "GPT_OSS_DEADLINE_S", 0.2)
+
+    async def main():
+        questions = await gpt_oss.generate_followup_questions("кашель", n=2)
+        await asyncio.sleep(0.05)
+        stats = client.stats()
+        await client.aclose()
+        return questions, stats
+
+    questions, stats = asyncio.run(main())
+    assert questions == gpt_oss.FALLBACK_QUESTIONS[:2]
+    assert stats["in_flight"] == 0
+    # the abandoned call counts against the breaker without waiting for the upstream
+    assert client.breaker.consecutive == 1
+
+
+def test_breaker_opens_on_failures_and_closes_after_a_good_probe(stub):
+    client = make_client(stub, failures=2, cooldown_s=0.3)
+
+    async def main():
+        configure(stub, fail_rate=1)
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.complete("failing")
+        assert client.breaker.state == "open"
+
+        before = stub_calls(stub)
+        with pytest.raises(CircuitOpen):
+            await client.complete("failing")
+        assert stub_calls(stub) == before
+
+        configure(stub)
+        await asyncio.sleep(0.35)
+        assert client.breaker.state == "half-open"
+        assert gpt_oss.parse_questions(await client.complete("probe"))
+        assert client.breaker.state == "closed"
+        await client.aclose()
+
+    asyncio.run(main())
+
+
+def test_client_survives_a_new_event_loop(stub):
+    configure(stub)
+    client = make_client(stub)
+    first = asyncio.run(client.complete("loop one"))
+    # the first loop is closed now; its session must not be reused
+    second = asyncio.run(client.complete("loop two"))
+    assert first == second
+
+
+def test_empty_question_list_is_returned_as_is(monkeypatch):
+    class EmptyAnswer:
+        async def complete(self, prompt):
+            return "[]"
+
+    monkeypatch.setattr(gpt_oss, "client", EmptyAnswer())
+    assert asyncio.run(gpt_oss.generate_followup_questions("кашель")) == []
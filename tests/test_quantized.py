@@ -0,0 +1,16 @@
+import numpy as np
+
+from src.engine.ann import build_ann
+from src.engine.retrieve import QuantizedRows
+
+
+def test_quantized_rows_decode_only_the_requested_rows():
+    xb = np.random.default_rng(0).normal(size=(500, 16)).astype(np.float32)
+    xb /= np.linalg.norm(xb, axis=1, keepdims=True)
+    rows = QuantizedRows(build_ann(xb, "int8", {}))
+
+    assert len(rows) == 500 and rows.shape == (500, 16)
+    ids = np.array([7, 3, 499])
+    decoded = rows[ids]
+    assert decoded.shape == (3, 16) and decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, xb[ids], atol=0.02)
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+
+from src.engine import rerank
+from src.engine.rerank import Reranker
+
+
+class SlowModel:
+    """Cross-encoder stand-in that takes `pair_s` seconds per pair."""
+
+    def __init__(self, pair_s):
+        self.pair_s = pair_s
+        self.pairs = 0
+
+    def predict(self, pairs, **kwargs):
+        time.sleep(self.pair_s * len(pairs))
+        self.pairs += len(pairs)
+        return np.arange(len(pairs), dtype=np.float32)
+
+
+def make_reranker(model_pair_s, estimate_pair_s, budget_ms=100.0, batch_size=8):
+    rerank.score_cache.clear()
+    r = Reranker("stub", budget_ms, batch_size, 128)
+    r._model = SlowModel(model_pair_s)
+    r.pair_s = estimate_pair_s
+    return r
+
+
+def block(n_queries, n_cand=20):
+    queries = [f"query {i}" for i in range(n_queries)]
+    candidates = [np.arange(n_cand) + 100 * i for i in range(n_queries)]
+    return queries, candidates
+
+
+def test_many_query_block_stays_within_one_budget():
+    # the budget pays for 40 pairs: two queries of 20 candidates
+    r = make_reranker(0.0025, 0.0025)
+    queries, candidates = block(32)
+    t0 = time.perf_counter()
+    results = r.score(queries, candidates, lambda pos: f"chunk {pos}", version="v")
+    elapsed = time.perf_counter() - t0
+
+    assert [res is not None for res in results] == [True, True] + [False] * 30
+    assert r._model.pairs == 40
+    assert elapsed < 1.5 * r.budget_s
+
+
+def test_pass_that_overruns_stops_between_batches():
+    # the estimate is 10x too optimistic: everything is admitted, the pass is cut short
+    r = make_reranker(0.005, 0.0005)
+    queries, candidates = block(8)
+    t0 = time.perf_counter()
+    results = r.score(queries, candidates, lambda pos: f"chunk {pos}", version="v")
+    elapsed = time.perf_counter() - t0
+
+    assert results[0] is not None
+    assert results[-1] is None
+    assert elapsed < r.budget_s + 2 * r.batch_size * 0.005
+
+
+def test_unknown_cost_keeps_bi_encoder_order(monkeypatch):
+    r = make_reranker(0.0, None)
+    started = []
+    monkeypatch.setattr(r, "_warmup_in_background", lambda: started.append(True))
+    queries, candidates = block(4)
+    results = r.score(queries, candidates, lambda pos: f"chunk {pos}", version="v")
+
+    assert results == [None] * 4
+    assert r._model.pairs == 0
+    assert started
+
+
+def test_cached_queries_need_no_budget():
+    r = make_reranker(0.0, 0.001)
+    queries, candidates = block(1)
+    first = r.score(queries, candidates, lambda pos: f"chunk {pos}", version="v")
+    r.pair_s = None
+    again = r.score(queries, candidates, lambda pos: f"chunk {pos}", version="v")
+
+    np.testing.assert_array_equal(first[0], again[0])
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+
+from src.api import serve
+from src.engine import retrieve
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.pid = os.getpid()
+
+    def encode(self, texts, normalize_embeddings=True):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_supervisor_maps_index_and_each_forked_worker_loads_its_own_encoder(monkeypatch):
+    monkeypatch.setattr(retrieve, "_MODEL", None)
+    monkeypatch.setattr(retrieve, "_ACTIVE", None)
+    monkeypatch.setattr(retrieve, "load_snapshot", lambda path: "snapshot")
+    monkeypatch.setattr(retrieve, "resolve_index_dir", lambda path: path)
+    monkeypatch.setattr(retrieve, "load_encoder", lambda name: FakeEncoder())
+
+    assert serve._preload() == "snapshot"
+    assert retrieve._MODEL is None
+
+    pids = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            model = retrieve.encoder()
+            ok = model.pid == os.getpid() and model.encode(["warmup"]).shape == (1, 4)
+            os._exit(0 if ok else 1)
+        pids.append(pid)
+    assert [os.waitpid(pid, 0)[1] for pid in pids] == [0, 0, 0]
+    assert retrieve._MODEL is None
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+from src.api import main
+from src.engine.indexing import CURRENT_FILE, VERSIONS_DIR, publish_version, stage_version
+
+
+def publish(root, name):
+    staging = root / VERSIONS_DIR / f".staging-{name}"
+    staging.mkdir(parents=True)
+    return publish_version(root, name, staging, keep=2)
+
+
+def versions(root):
+    return sorted(p.name for p in (root / VERSIONS_DIR).iterdir() if not p.name.startswith("."))
+
+
+def test_publish_keeps_the_previous_current_and_newer(tmp_path):
+    for name in ("v1", "v2", "v3"):
+        publish(tmp_path, name)
+    assert versions(tmp_path) == ["v2", "v3"]
+
+    # rolled back to v2: a worker may still map it, so v4 does not prune it
+    (tmp_path / CURRENT_FILE).write_text("v2\n")
+    publish(tmp_path, "v4")
+    assert versions(tmp_path) == ["v2", "v3", "v4"]
+    assert (tmp_path / CURRENT_FILE).read_text().strip() == "v4"
+
+    publish(tmp_path, "v5")
+    assert versions(tmp_path) == ["v4", "v5"]
+
+
+def test_stage_version_is_hidden_until_published(tmp_path):
+    name, staging = stage_version(tmp_path)
+    assert staging.name.startswith(".")
+    assert versions(tmp_path) == []
+    publish_version(tmp_path, name, staging)
+    assert versions(tmp_path) == [name]
+
+
+def test_admin_reload_is_refused_without_a_configured_token(monkeypatch):
+    monkeypatch.setattr(main, "reload", lambda force=False: {"reloaded": True})
+    client = TestClient(main.app)
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.post("/admin/reload").status_code == 403
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "secret"}).json() == {"reloaded": True}
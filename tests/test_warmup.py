@@ -0,0 +1,25 @@
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from src.api import main
+
+
+def test_failed_background_warmup_is_logged_and_shown_by_health(monkeypatch, caplog):
+    def broken_warmup():
+        raise FileNotFoundError("Index not found")
+
+    monkeypatch.setattr(main, "WARMUP", "background")
+    monkeypatch.setattr(main, "warmup", broken_warmup)
+    monkeypatch.setattr(main, "warmup_future", None)
+    with caplog.at_level(logging.ERROR, logger=main.log.name), TestClient(main.app) as client:
+        for _ in range(100):
+            health = client.get("/health").json()
+            if "warmup_error" in health:
+                break
+            time.sleep(0.01)
+
+    assert health["ready"] is False
+    assert "Index not found" in health["warmup_error"]
+    assert "Background warmup failed" in caplog.text